@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+# Benchmarks of the conversion, table, plot and export paths on synthetic
+# multimeter logs. Qt runs on the offscreen platform, so no display is needed:
+#
+#   python fishbench.py -o results.json
+#   python fishbench.py --sizes 1e3 1e5 -o new.json --baseline results.json
+
+import sys
+import os
+import time
+import json
+import platform
+import argparse
+import tempfile
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy
+
+import fishcore
+
+DEFAULT_SIZES = ("1e3", "1e4", "1e5", "1e6", "1e7")
+SEPARATOR = ";"
+START = 10
+END = 90
+
+
+def syntheticValues(rows):
+    # A few Gaussian peaks on a sloped background with Poisson noise; the
+    # generator is seeded with the size so every run reads the same file
+    rng = numpy.random.default_rng(rows)
+    x = numpy.linspace(START, END, rows)
+    y = 50 + 0.5 * x
+    for center, width, height in ((28.4, 0.15, 900), (33.1, 0.2, 400), (47.3, 0.25, 600), (56.1, 0.3, 300), (69.2, 0.35, 150)):
+        y += height * numpy.exp(-4 * numpy.log(2) * ((x - center) / width) ** 2)
+    return rng.poisson(y).astype(numpy.float64)
+
+
+def syntheticFile(directory, rows):
+    file_name = os.path.join(directory, "synthetic-%d.csv" % rows)
+    if not os.path.isfile(file_name):
+        values = syntheticValues(rows)
+        seconds = numpy.arange(rows, dtype=numpy.float64) * 0.1
+        tmp = file_name + ".tmp"
+        fishcore.writeText(tmp, (seconds, values), ("Time", "Value"), SEPARATOR)
+        os.replace(tmp, file_name)
+    return file_name
+
+
+def measure(func, repeat, setup=None):
+    # Best and median wall time over `repeat` runs, then one more run under
+    # tracemalloc for the peak memory (tracing would distort the timings)
+    times = []
+    for i in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    args = setup() if setup is not None else ()
+    tracemalloc.start()
+    try:
+        func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(times), 'median': float(numpy.median(times)), 'peak_bytes': peak}
+
+
+class Bench:
+    def __init__(self, directory, repeat):
+        from PySide2 import QtCore, QtWidgets
+
+        self.QtCore = QtCore
+        self.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+        import fishx
+
+        self.fishx = fishx
+        self.directory = directory
+        self.repeat = repeat
+        self.win = fishx.MainWindow()
+        self.win.resize(1200, 900)
+        self.win.show()
+
+    def processEvents(self):
+        # Closed sub-windows are deleted later, and only then are their datasets released
+        self.app.processEvents()
+        self.app.sendPostedEvents(None, self.QtCore.QEvent.DeferredDelete)
+
+    def closeWindows(self):
+        for window in list(self.win.windows.values()):
+            window.close()
+        self.processEvents()
+
+    def convert(self, file_name):
+        result = {}
+
+        def run():
+            thread = self.fishx.FishThread(file_name, SEPARATOR, START, END)
+            thread.finished.connect(lambda name, data: result.update(data))
+            thread.errorSignal.connect(lambda err: result.update(error=err))
+            thread.run()
+            if 'error' in result:
+                raise RuntimeError(result['error'])
+
+        stats = measure(run, self.repeat)
+        return stats, result
+
+    def table(self, data):
+        def run():
+            self.win.loadTable("bench", data)
+            window = list(self.win.windows.values())[-1]
+            window.widget().build()
+            self.processEvents()
+            self.closeWindows()
+
+        return measure(run, self.repeat)
+
+    def selection(self, data):
+        def setup():
+            self.closeWindows()
+            self.win.loadTable("bench", data)
+            widget = list(self.win.windows.values())[-1].widget()
+            widget.build()
+            widget.tableView.selectAll()
+            return (widget,)
+
+        stats = measure(lambda widget: widget.get_Data(), self.repeat, setup)
+        self.closeWindows()
+        return stats
+
+    def plot(self, data):
+        dataset = self.win.datasets.add("bench", (data['two_theta'], data['intensity']))
+
+        def run():
+            widget = self.fishx.PlotWidget(self.win, "bench")
+            widget.set_Datasets([dataset], ["bench"])
+            self.win.loadSubWindow(widget)
+            widget.build()
+            widget.sc.draw()
+            self.closeWindows()
+
+        stats = measure(run, self.repeat)
+        self.win.datasets.remove(dataset.id)
+        return stats
+
+    def export(self, data, extension):
+        file_name = os.path.join(self.directory, "export" + extension)
+
+        def run():
+            fishcore.saveColumns(file_name, (data['two_theta'], data['intensity']), ("two_theta", "intensity"), ",")
+
+        stats = measure(run, self.repeat)
+        os.remove(file_name)
+        return stats
+
+    def run(self, rows):
+        file_name = syntheticFile(self.directory, rows)
+        results = {}
+        results['convert'], data = self.convert(file_name)
+        results['table'] = self.table(data)
+        results['table selection'] = self.selection(data)
+        results['plot'] = self.plot(data)
+        results['export csv'] = self.export(data, ".csv")
+        results['export npy'] = self.export(data, ".npy")
+        for name, stats in results.items():
+            stats['rows'] = rows
+            stats['rows_per_second'] = rows / stats['seconds'] if stats['seconds'] > 0 else None
+        return results
+
+
+def compare(results, baseline, threshold):
+    # Returns the names of the benchmarks that got slower than baseline * (1 + threshold)
+    regressions = []
+    print("%-28s %12s %12s %9s" % ("benchmark", "baseline, s", "current, s", "ratio"))
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]['seconds']
+        ratio = stats['seconds'] / old if old > 0 else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            mark = "  SLOWER"
+        elif ratio < 1 / (1 + threshold):
+            mark = "  faster"
+        print("%-28s %12.4f %12.4f %9.2f%s" % (name, old, stats['seconds'], ratio, mark))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="fishbench", description="Benchmarks of FishX on synthetic multimeter logs")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="numbers of rows (default: 1e3 ... 1e7)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark, the best is reported (default: 3)")
+    parser.add_argument("--data", default=os.path.join(tempfile.gettempdir(), "fishbench"), help="directory of the generated logs, reused between runs")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression (default: 0.1)")
+
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data, exist_ok=True)
+    bench = Bench(args.data, max(1, args.repeat))
+
+    results = {}
+    for size in args.sizes:
+        rows = int(float(size))
+        for name, stats in bench.run(rows).items():
+            key = "%s/%d" % (name, rows)
+            results[key] = stats
+            print("%-28s %10.4f s %14.0f rows/s %10.1f MB" % (key, stats['seconds'], stats['rows_per_second'] or 0, stats['peak_bytes'] / 2 ** 20))
+            sys.stdout.flush()
+
+    report = {
+        'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': numpy.__version__,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\n%d benchmark(s) slower than the baseline by more than %d%%" % (len(regressions), args.threshold * 100))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
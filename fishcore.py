@@ -0,0 +1,1509 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import io
+import json
+import math
+import mmap
+import struct
+import glob
+import time
+import hashlib
+import argparse
+import threading
+import traceback
+import tracemalloc
+import collections
+import multiprocessing
+import concurrent.futures
+
+import numpy
+
+# DRON-2 goniometer correction: 2θ - (OFFSET + SLOPE * 2θ)
+TWO_THETA_OFFSET = 0.544
+TWO_THETA_SLOPE = 0.000599591
+
+# Calibration profiles are kept next to settings.ini
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "calibrations.json")
+DEFAULT_CALIBRATION = "DRON-2"
+# Range and step (°) over which higher-degree polynomial corrections are sampled
+CALIBRATION_RANGE = (0.0, 180.0)
+CALIBRATION_STEP = 0.001
+
+
+# Rows per chunk of the streaming reader
+STREAM_CHUNK_SIZE = 100000
+
+SESSION_MAGIC = b"FISHXSES"
+SESSION_VERSION = 1
+SESSION_ALIGN = 64
+
+# Reference cards (d, I) and their compiled index are kept next to settings.ini
+REFERENCE_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "references")
+REFERENCE_INDEX = "index.fxr"
+REFERENCE_EXTENSIONS = (".txt", ".dif", ".dat", ".csv")
+
+
+def readValues(file_name, separator):
+    import pandas
+
+    data = pandas.read_csv(file_name, sep=separator, usecols=["Value"])
+    return data["Value"].to_numpy(dtype=numpy.float64)
+
+
+def readChunks(file_name, separator, chunk_size=STREAM_CHUNK_SIZE):
+    import pandas
+
+    for chunk in pandas.read_csv(file_name, sep=separator, usecols=["Value"], chunksize=chunk_size):
+        yield chunk["Value"].to_numpy(dtype=numpy.float64)
+
+
+def countRows(file_name, block_size=1 << 20):
+    # Number of data rows (lines without the header), counted without parsing
+    lines = 0
+    last = b"\n"
+    with open(file_name, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1
+    return max(lines - 1, 0)
+
+
+class Calibration:
+    # Goniometer correction subtracted from the nominal 2θ: a polynomial (constant term first) or
+    # (2θ, correction) points held constant past the ends, applied with one numpy.interp pass
+    def __init__(self, name, kind="polynomial", coefficients=(), points=()):
+        self.name = name
+        self.kind = kind
+        self.coefficients = [float(it) for it in coefficients]
+        self.points = sorted([float(a), float(b)] for a, b in points)
+        if kind == "table" and not self.points:
+            raise ValueError("Calibration " + repr(name) + " has no points")
+        if kind not in ("polynomial", "table"):
+            raise ValueError("Unknown calibration kind: " + str(kind))
+        self.table = None
+
+    def key(self):
+        # Identifies the correction itself, so a recalibrated profile gets new cache entries
+        return (self.kind, tuple(self.coefficients), tuple(map(tuple, self.points)))
+
+    def get_State(self):
+        if self.kind == "polynomial":
+            return {'name': self.name, 'kind': self.kind, 'coefficients': self.coefficients}
+        return {'name': self.name, 'kind': self.kind, 'points': self.points}
+
+    def correction(self, two_theta):
+        if self.kind == "polynomial":
+            return numpy.polynomial.polynomial.polyval(two_theta, self.coefficients or [0.0])
+        points = numpy.array(self.points)
+        return numpy.interp(two_theta, points[:, 0], points[:, 1])
+
+    def compile(self):
+        if self.kind == "polynomial" and len(self.coefficients) <= 2:
+            self.table = tuple(self.coefficients + [0.0] * (2 - len(self.coefficients)))
+        elif self.kind == "table":
+            points = numpy.array(self.points)
+            self.table = (points[:, 0].copy(), points[:, 1].copy())
+        else:
+            lo, hi = CALIBRATION_RANGE
+            grid = lo + numpy.arange(int(round((hi - lo) / CALIBRATION_STEP)) + 1) * CALIBRATION_STEP
+            self.table = (grid, self.correction(grid))
+        return self
+
+    def apply(self, two_theta):
+        # Corrects the nominal angles in place and rounds them to 0.001°
+        if self.table is None:
+            self.compile()
+        if isinstance(self.table[0], float):
+            offset, slope = self.table
+            two_theta -= offset + slope * two_theta
+        else:
+            correction = numpy.interp(two_theta, *self.table)
+            if self.kind == "polynomial":
+                # numpy.interp holds the ends, the polynomial is evaluated past the sampled range
+                outside = (two_theta < self.table[0][0]) | (two_theta > self.table[0][-1])
+                if outside.any():
+                    correction[outside] = self.correction(two_theta[outside])
+            two_theta -= correction
+        return numpy.round(two_theta, 3)
+
+
+DRON_2 = Calibration(DEFAULT_CALIBRATION, "polynomial", (TWO_THETA_OFFSET, TWO_THETA_SLOPE))
+NO_CALIBRATION = Calibration("None", "polynomial", ())
+
+
+def loadCalibrations(file_name=CALIBRATION_FILE):
+    # Profiles by name; the built-in ones can be redefined in the file
+    profiles = collections.OrderedDict((it.name, it) for it in (DRON_2, NO_CALIBRATION))
+    if os.path.isfile(file_name):
+        with open(file_name, encoding="utf-8") as f:
+            data = json.load(f)
+        for it in data.get("profiles", []):
+            profile = Calibration(it["name"], it.get("kind", "polynomial"), it.get("coefficients", ()), it.get("points", ()))
+            profiles[profile.name] = profile
+    return profiles
+
+
+def saveCalibrations(profiles, file_name=CALIBRATION_FILE):
+    with open(file_name, "w", encoding="utf-8") as f:
+        json.dump({'profiles': [it.get_State() for it in profiles]}, f, indent=1, ensure_ascii=False)
+
+
+def twoThetaGrid(rows, min_A, max_A, calibration=None):
+    # Grid point i of n = rows - 1 points pairs with sample i, 1 <= i <= n - 1, as the list conversion did
+    min_A = float(min_A)
+    max_A = float(max_A)
+    n = rows - 1
+    if n < 2:
+        raise ValueError("At least 3 samples are required, got %d" % rows)
+
+    two_theta = min_A + numpy.arange(1, n, dtype=numpy.float64) * ((max_A - min_A) / (n - 1))
+    return correctTwoTheta(two_theta, calibration)
+
+
+def stepGrid(min_A, step, first, count, calibration=None):
+    # Corrected angles of samples first .. first + count - 1 of a log with a known step
+    return correctTwoTheta(float(min_A) + numpy.arange(first, first + count, dtype=numpy.float64) * float(step), calibration)
+
+
+def calibratedGrid(meta, length, calibration):
+    # 2θ column of a converted log recomputed from its import parameters
+    if "end" in meta:
+        return twoThetaGrid(length + 2, meta["start"], meta["end"], calibration)
+    return stepGrid(meta["start"], meta["step"], 1, length, calibration)
+
+
+def correctTwoTheta(two_theta, calibration=None):
+    return (calibration or DRON_2).apply(two_theta)
+
+
+def convert(values, min_A, max_A, calibration=None):
+    values = numpy.asarray(values, dtype=numpy.float64)
+    two_theta = twoThetaGrid(len(values), min_A, max_A, calibration)
+    intensity = values[1:len(values) - 1].copy()
+    return two_theta, intensity
+
+
+def convertFile(file_name, separator, min_A, max_A, calibration=None):
+    return convert(readValues(file_name, separator), min_A, max_A, calibration)
+
+
+class StreamConverter:
+    # Incremental convert(): the grid is known from the row count, the intensity is filled chunk by chunk
+    def __init__(self, rows, min_A, max_A, calibration=None):
+        self.rows = rows
+        self.min_A = min_A
+        self.max_A = max_A
+        self.calibration = calibration
+        self.two_theta = twoThetaGrid(rows, min_A, max_A, calibration)
+        self.intensity = numpy.zeros(len(self.two_theta), dtype=numpy.float64)
+        self.read = 0
+        self.count = 0
+
+    def feed(self, values):
+        start = self.read
+        self.read += len(values)
+        lo = max(start, 1)
+        hi = min(self.read, self.rows - 1)
+        if hi > lo:
+            self.intensity[lo - 1:hi - 1] = values[lo - start:hi - start]
+            self.count = hi - 1
+        return self.count
+
+    def finish(self):
+        # countRows() also counts blank lines that the parser skips
+        if self.read > self.rows:
+            raise ValueError("The file has grown while it was being read")
+        if self.read < self.rows:
+            self.rows = self.read
+            self.two_theta = twoThetaGrid(self.rows, self.min_A, self.max_A, self.calibration)
+            self.intensity = self.intensity[:len(self.two_theta)].copy()
+            self.count = len(self.two_theta)
+        return self.count
+
+    def calibrate(self, calibration):
+        self.calibration = calibration
+        self.two_theta[:] = twoThetaGrid(self.rows, self.min_A, self.max_A, calibration)
+
+
+class TailReader:
+    # Samples of the Value column appended since the previous call
+    def __init__(self, file_name, separator):
+        self.file_name = file_name
+        self.separator = separator
+        self.offset = 0
+        self.pending = b""
+        self.column = None
+
+    def read(self):
+        with open(self.file_name, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < self.offset:
+                raise ValueError("The file has been truncated")
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+        data = self.pending + data
+        end = data.rfind(b"\n") + 1
+        self.pending = data[end:]
+        text = data[:end].decode(errors="replace")
+        if self.column is None:
+            if end == 0:
+                return numpy.empty(0)
+            header, text = text.split("\n", 1)
+            names = [it.strip().strip('"') for it in (header.split() if self.separator == " " else header.split(self.separator))]
+            self.column = names.index("Value")
+        if text.strip() == "":
+            return numpy.empty(0)
+        delimiter = None if self.separator == " " else self.separator
+        return numpy.loadtxt(io.StringIO(text), delimiter=delimiter, usecols=self.column, ndmin=1, dtype=numpy.float64)
+
+
+class LiveConverter:
+    # Conversion of a growing log on a grid built from the start angle and the step per sample
+    def __init__(self, min_A, step, calibration=None):
+        self.min_A = float(min_A)
+        self.step = float(step)
+        self.calibration = calibration
+        self.samples = 0
+        self.count = 0
+        self.two_theta = numpy.empty(1024, dtype=numpy.float64)
+        self.intensity = numpy.empty(1024, dtype=numpy.float64)
+
+    def feed(self, values):
+        start = self.samples
+        self.samples += len(values)
+        values = values[max(1 - start, 0):]
+        if len(values) == 0:
+            return self.count
+        first = max(start, 1)
+        end = self.count + len(values)
+        if end > len(self.two_theta):
+            capacity = max(end, 2 * len(self.two_theta))
+            self.two_theta = numpy.concatenate((self.two_theta[:self.count], numpy.empty(capacity - self.count)))
+            self.intensity = numpy.concatenate((self.intensity[:self.count], numpy.empty(capacity - self.count)))
+        self.two_theta[self.count:end] = stepGrid(self.min_A, self.step, first, len(values), self.calibration)
+        self.intensity[self.count:end] = values
+        self.count = end
+        return self.count
+
+    def calibrate(self, calibration):
+        # The arrays stay the same objects, samples read later use the new profile too
+        self.calibration = calibration
+        self.two_theta[:self.count] = stepGrid(self.min_A, self.step, 1, self.count, calibration)
+
+
+def isSorted(x):
+    return len(x) < 2 or bool(numpy.all(x[1:] >= x[:-1]))
+
+
+def mergeRanges(ranges):
+    # Sorted, non-overlapping [start, stop) row ranges
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        elif start < stop:
+            merged.append([start, stop])
+    return merged
+
+
+def selectRows(columns, ranges):
+    # Rows of the ranges taken as slices of the columns; a single range is a view
+    ranges = mergeRanges(ranges)
+    if len(ranges) == 1:
+        return [it[ranges[0][0]:ranges[0][1]] for it in columns]
+    return [numpy.concatenate([it[start:stop] for start, stop in ranges]) if ranges else it[:0] for it in columns]
+
+
+def decimate(x, y, x_min, x_max, buckets):
+    # Min/max decimation of the samples in [x_min, x_max] (x sorted), so peaks survive at any zoom level
+    lo = max(int(numpy.searchsorted(x, x_min, "left")) - 1, 0)
+    hi = min(int(numpy.searchsorted(x, x_max, "right")) + 1, len(x))
+    n = hi - lo
+    if n <= 4 * buckets:
+        return x[lo:hi], y[lo:hi]
+
+    size = -(-n // buckets)
+    buckets = n // size
+    m = size * buckets
+    block = y[lo:lo + m].reshape(buckets, size)
+    i_min = block.argmin(axis=1)
+    i_max = block.argmax(axis=1)
+    base = lo + numpy.arange(buckets) * size
+    index = [numpy.array([lo]), (base[:, None] + numpy.sort(numpy.stack((i_min, i_max), axis=1), axis=1)).ravel()]
+    if m < n:
+        tail = y[lo + m:hi]
+        index.append(lo + m + numpy.sort(numpy.array([tail.argmin(), tail.argmax()])))
+    index.append(numpy.array([hi - 1]))
+    index = numpy.concatenate(index)
+    return x[index], y[index]
+
+
+# Kα1 and Kα2 wavelengths (Å) of common anodes
+ANODES = {
+    "Cu": (1.540562, 1.544390),
+    "Co": (1.788965, 1.792850),
+    "Fe": (1.936042, 1.939980),
+    "Cr": (2.289700, 2.293606),
+    "Mo": (0.709300, 0.713590),
+}
+
+PEAK_COLUMNS = ("two_theta", "height", "fwhm", "centroid", "d")
+
+
+def dSpacing(two_theta, wavelength):
+    return wavelength / (2 * numpy.sin(numpy.radians(numpy.asarray(two_theta) / 2)))
+
+
+def concatenatePatterns(patterns):
+    # Several patterns in one array pair; start/stop are the bounds of every pattern
+    lengths = numpy.array([len(it[0]) for it in patterns], dtype=numpy.intp)
+    stop = numpy.cumsum(lengths)
+    start = stop - lengths
+    x = numpy.concatenate([numpy.asarray(it[0], dtype=numpy.float64) for it in patterns]) if patterns else numpy.empty(0)
+    y = numpy.concatenate([numpy.asarray(it[1], dtype=numpy.float64) for it in patterns]) if patterns else numpy.empty(0)
+    return x, y, start, stop
+
+
+def findPeaks(patterns, wavelength, min_height=0.05, separation=0.1, max_width=1.0):
+    # A peak is the highest sample within ±separation that rises min_height (share of the pattern
+    # range) above the lowest sample within ±max_width. One (peaks, len(PEAK_COLUMNS)) array per pattern.
+    x, y, start, stop = concatenatePatterns(patterns)
+    result = [numpy.empty((0, len(PEAK_COLUMNS))) for it in patterns]
+    if len(x) < 3:
+        return result
+
+    lengths = stop - start
+    segment = numpy.repeat(numpy.arange(len(patterns)), lengths)
+    minimum = numpy.array([y[a:b].min() if b > a else 0.0 for a, b in zip(start, stop)])
+    span = numpy.array([numpy.ptp(y[a:b]) if b > a else 0.0 for a, b in zip(start, stop)])
+    step = numpy.array([numpy.median(numpy.abs(numpy.diff(x[a:b]))) if b - a > 1 else 1.0 for a, b in zip(start, stop)])
+    step[~(step > 0)] = 1.0
+    window = numpy.maximum(numpy.rint(separation / step), 1).astype(numpy.intp)
+    width = numpy.maximum(numpy.rint(max_width / step), window).astype(numpy.intp)
+
+    candidate = numpy.zeros(len(x), dtype=bool)
+    candidate[1:-1] = (y[1:-1] > y[:-2]) & (y[1:-1] >= y[2:])
+    candidate[start[lengths > 0]] = False
+    candidate[stop[lengths > 0] - 1] = False
+    candidate &= y - minimum[segment] >= min_height * span[segment]
+    peak = numpy.flatnonzero(candidate)
+    if len(peak) == 0:
+        return result
+
+    seg = segment[peak]
+    lo = start[seg][:, None]
+    hi = stop[seg][:, None] - 1
+
+    steps = numpy.arange(-window[seg].max(), window[seg].max() + 1)
+    index = numpy.clip(peak[:, None] + steps, lo, hi)
+    around = numpy.where(numpy.abs(steps) <= window[seg][:, None], y[index], -numpy.inf)
+    peak = peak[around.max(axis=1) <= y[peak]]
+    seg = segment[peak]
+    lo = start[seg][:, None]
+    hi = stop[seg][:, None] - 1
+
+    steps = numpy.arange(width[seg].max() + 1) if len(peak) else numpy.arange(1)
+    reach = steps[None, :] <= width[seg][:, None]
+    left = numpy.clip(peak[:, None] - steps, lo, hi)
+    right = numpy.clip(peak[:, None] + steps, lo, hi)
+    base = numpy.minimum(numpy.where(reach, y[left], numpy.inf).min(axis=1), numpy.where(reach, y[right], numpy.inf).min(axis=1))
+    keep = y[peak] - base >= min_height * span[seg]
+    peak, seg, base, reach, left, right = peak[keep], seg[keep], base[keep], reach[keep], left[keep], right[keep]
+
+    # Sub-sample position from the parabola through the three top samples
+    y0, y1, y2 = y[peak - 1], y[peak], y[peak + 1]
+    curvature = y0 - 2 * y1 + y2
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        delta = numpy.where(curvature < 0, 0.5 * (y0 - y2) / curvature, 0.0)
+    position = x[peak] + delta * (x[peak + 1] - x[peak - 1]) / 2
+
+    half = (y1 + base) / 2
+    below_left = reach & (y[left] < half[:, None])
+    below_right = reach & (y[right] < half[:, None])
+    found = below_left.any(axis=1) & below_right.any(axis=1)
+    k_left = below_left.argmax(axis=1)
+    k_right = below_right.argmax(axis=1)
+
+    def crossing(a, b):
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return x[a] + (half - y[a]) * (x[b] - x[a]) / (y[b] - y[a])
+
+    a_left = peak - k_left
+    a_right = peak + k_right
+    fwhm = numpy.where(found, crossing(a_right, numpy.maximum(a_right - 1, peak)) - crossing(a_left, numpy.minimum(a_left + 1, peak)), numpy.nan)
+
+    weight_left = numpy.where(steps[None, :] < k_left[:, None], y[left] - half[:, None], 0.0)
+    weight_right = numpy.where((steps[None, :] < k_right[:, None]) & (steps[None, :] > 0), y[right] - half[:, None], 0.0)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        centroid = ((weight_left * x[left]).sum(axis=1) + (weight_right * x[right]).sum(axis=1)) / (weight_left.sum(axis=1) + weight_right.sum(axis=1))
+    centroid = numpy.where(found, centroid, numpy.nan)
+
+    table = numpy.column_stack((position, y1, fwhm, centroid, dSpacing(position, wavelength)))
+    for it in range(len(patterns)):
+        result[it] = table[seg == it]
+    return result
+
+
+def savitzkyGolay(y, window, order):
+    y = numpy.asarray(y, dtype=numpy.float64)
+    half = int(window) // 2
+    if order >= 2 * half + 1:
+        raise ValueError("The polynomial order must be less than the window length")
+    if len(y) == 0 or half == 0:
+        return y.copy()
+    vander = numpy.vander(numpy.arange(-half, half + 1, dtype=numpy.float64), int(order) + 1, increasing=True)
+    coefficients = numpy.linalg.pinv(vander)[0]
+    return numpy.convolve(numpy.pad(y, half, mode="edge"), coefficients[::-1], mode="valid")
+
+
+def movingAverage(y, window):
+    y = numpy.asarray(y, dtype=numpy.float64)
+    half = int(window) // 2
+    if len(y) == 0 or half == 0:
+        return y.copy()
+    total = numpy.concatenate(([0.0], numpy.cumsum(numpy.pad(y, half, mode="edge"))))
+    return (total[2 * half + 1:] - total[:-2 * half - 1]) / (2 * half + 1)
+
+
+def polynomialBackground(x, y, order, iterations=30):
+    # Polynomial refitted to the data clipped by the previous fit
+    x = numpy.asarray(x, dtype=numpy.float64)
+    background = numpy.asarray(y, dtype=numpy.float64).copy()
+    if len(x) == 0:
+        return background
+    # x is scaled to [-1, 1], the pseudo-inverse is computed once
+    span = x.max() - x.min()
+    scaled = (2 * x - x.max() - x.min()) / (span if span > 0 else 1.0)
+    vander = numpy.polynomial.polynomial.polyvander(scaled, int(order))
+    inverse = numpy.linalg.pinv(vander)
+    for it in range(iterations):
+        fit = vander @ (inverse @ background)
+        clipped = numpy.minimum(background, fit)
+        if numpy.allclose(clipped, background):
+            break
+        background = clipped
+    return fit
+
+
+def snipBackground(y, iterations):
+    # SNIP on LLS-transformed data
+    y = numpy.asarray(y, dtype=numpy.float64)
+    offset = y.min() if len(y) else 0.0
+    v = numpy.log(numpy.log(numpy.sqrt(y - offset + 1) + 1) + 1)
+    for p in range(1, min(int(iterations), (len(y) - 1) // 2) + 1):
+        v[p:-p] = numpy.minimum(v[p:-p], (v[:-2 * p] + v[2 * p:]) / 2)
+    return (numpy.exp(numpy.exp(v) - 1) - 1) ** 2 - 1 + offset
+
+
+def stripKa2(x, y, ka1, ka2, ratio=0.5):
+    # Rachinger correction: I1(2θ) = I(2θ) - ratio * I1(2θ - Δ(2θ))
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    if len(x) < 2:
+        return y.copy()
+    if not isSorted(x):
+        raise ValueError("2θ must be increasing")
+    sine = numpy.clip(ka2 / ka1 * numpy.sin(numpy.radians(x / 2)), -1, 1)
+    source = 2 * x - 2 * numpy.degrees(numpy.arcsin(sine))
+    valid = source >= x[0]
+    index = numpy.clip(numpy.searchsorted(x, source, "right") - 1, 0, len(x) - 2)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        weight = (source - x[index]) / (x[index + 1] - x[index])
+    weight = numpy.where(valid & numpy.isfinite(weight), numpy.clip(weight, 0, 1), 0.0)
+    return rachingerRecurrence(y, index, weight, valid, float(ratio))
+
+
+def rachingerRecurrence(y, index, weight, valid, ratio):
+    # Far samples (source interval ends before them) only depend on earlier results and are solved a
+    # block at a time; runs of near samples are a linear recurrence solved by linearRecurrence
+    position = numpy.arange(len(y))
+    far = valid & (index + 1 < position)
+    near = valid & (index + 1 == position)
+    out = numpy.where(valid, y / (1 + ratio), y)
+    # Highest source interval end of the far samples up to each sample
+    reach = numpy.maximum.accumulate(numpy.where(far, index + 1, 0))
+    kind = far * 2 + near
+    stops = numpy.append(numpy.flatnonzero(numpy.diff(kind)) + 1, len(y))
+    start = 0
+    for stop in stops:
+        if kind[start] == 2:
+            block = start
+            while block < stop:
+                end = min(int(numpy.searchsorted(reach, block, "left")), stop)
+                a = index[block:end]
+                w = weight[block:end]
+                out[block:end] = y[block:end] - ratio * ((1 - w) * out[a] + w * out[a + 1])
+                block = end
+        elif kind[start] == 1:
+            # The source lies between the previous sample and this one
+            w = weight[start:stop]
+            out[start:stop] = linearRecurrence(-ratio * (1 - w) / (1 + ratio * w), y[start:stop] / (1 + ratio * w), out[start - 1])
+        start = stop
+    return out
+
+
+def linearRecurrence(c, d, first, block=64):
+    # out[k] = c[k] * out[k - 1] + d[k] with out[-1] = first, in closed form per block
+    out = numpy.empty(len(d))
+    for start in range(0, len(d), block):
+        cc = numpy.concatenate(([1.0], c[start:start + block]))
+        vector = numpy.concatenate(([first], d[start:start + block]))
+        size = len(cc)
+        factors = numpy.where(numpy.tri(size, k=-1, dtype=bool), cc[:, None], 1.0)
+        matrix = numpy.cumprod(factors, axis=0) * numpy.tri(size)
+        out[start:start + size - 1] = (matrix @ vector)[1:]
+        first = out[start + size - 2]
+    return out
+
+
+def runStage(stage, x, y, params):
+    # Processed intensity and, for background stages, the background
+    if stage == "savgol":
+        return savitzkyGolay(y, *params), None
+    if stage == "average":
+        return movingAverage(y, *params), None
+    if stage == "ka2":
+        return stripKa2(x, y, *params), None
+    if stage == "polynomial":
+        background = polynomialBackground(x, y, *params)
+    elif stage == "snip":
+        background = snipBackground(y, *params)
+    else:
+        raise ValueError("Unknown stage: " + str(stage))
+    return numpy.asarray(y, dtype=numpy.float64) - background, background
+
+
+ARITHMETIC = ("sum", "mean", "weighted mean", "difference", "normalized mean")
+
+
+def commonGrid(patterns, step=0):
+    # Grid over the range all patterns cover: their own grid when they share it, else the median step
+    if not patterns:
+        raise ValueError("No patterns")
+    first = patterns[0][0]
+    if step <= 0 and all(len(x) == len(first) and (x is first or numpy.array_equal(x, first)) for x, y in patterns):
+        # Copied: the grid is cached and must not keep a mapped or growing column alive
+        return first.copy()
+    lo = max(x[0] for x, y in patterns)
+    hi = min(x[-1] for x, y in patterns)
+    if hi <= lo:
+        raise ValueError("The patterns have no common 2θ range")
+    if step <= 0:
+        step = float(numpy.median([(x[-1] - x[0]) / max(len(x) - 1, 1) for x, y in patterns]))
+    return lo + numpy.arange(int(numpy.floor((hi - lo) / step + 1e-9)) + 1) * step
+
+
+def resamplePatterns(patterns, grid):
+    # (N, M) intensities of N patterns on the M points of the grid
+    matrix = numpy.empty((len(patterns), len(grid)), dtype=numpy.float64)
+    for row, (x, y) in zip(matrix, patterns):
+        if x is grid or len(x) == len(grid) and numpy.array_equal(x, grid):
+            row[:] = y
+        else:
+            row[:] = numpy.interp(grid, x, y)
+    return matrix
+
+
+def binColumns(matrix, lo, hi, columns):
+    # Min and max of at most `columns` buckets of the columns lo:hi, and the first column of each
+    n = hi - lo
+    if n <= columns:
+        block = matrix[:, lo:hi]
+        return numpy.arange(lo, hi), block, block
+    size = -(-n // columns)
+    m = n // size * size
+    block = matrix[:, lo:lo + m].reshape(len(matrix), -1, size)
+    low = block.min(axis=2)
+    high = block.max(axis=2)
+    start = numpy.arange(lo, lo + m, size)
+    if m < n:
+        tail = matrix[:, lo + m:hi]
+        low = numpy.column_stack((low, tail.min(axis=1)))
+        high = numpy.column_stack((high, tail.max(axis=1)))
+        start = numpy.append(start, lo + m)
+    return start, low, high
+
+
+def gridWindow(grid, x_min, x_max):
+    # Columns of the grid inside the visible range, one more on each side
+    lo = max(int(numpy.searchsorted(grid, x_min, "left")) - 1, 0)
+    hi = min(int(numpy.searchsorted(grid, x_max, "right")) + 1, len(grid))
+    return lo, hi
+
+
+def waterfallSegments(grid, matrix, lo, hi, columns, step):
+    # Min/max buckets of every row, each row raised by `step` over the previous one
+    start, low, high = binColumns(matrix, lo, hi, columns)
+    x = numpy.repeat(grid[start], 2)
+    y = numpy.stack((low, high), axis=2).reshape(len(matrix), -1)
+    y = y + step * numpy.arange(len(matrix))[:, None]
+    return numpy.stack((numpy.broadcast_to(x, y.shape), y), axis=2)
+
+
+def noiseSigma(matrix, samples=5000):
+    # Noise of every row from the median absolute second difference (6σ² for white noise)
+    index = numpy.arange(1, matrix.shape[1] - 1, max(1, (matrix.shape[1] - 2) // samples))
+    d2 = matrix[:, index - 1] - 2 * matrix[:, index] + matrix[:, index + 1]
+    return 1.4826 * numpy.median(numpy.abs(d2), axis=1) / numpy.sqrt(6)
+
+
+def combinePatterns(matrix, operation, factor=1.0):
+    if operation == "sum":
+        return matrix.sum(axis=0)
+    if operation == "mean":
+        return matrix.mean(axis=0)
+    if operation == "weighted mean":
+        # Inverse-variance weights, so noisier (shorter) scans count less
+        variance = noiseSigma(matrix) ** 2
+        positive = variance > 0
+        if not positive.any():
+            return matrix.mean(axis=0)
+        weights = numpy.where(positive, 1 / numpy.where(positive, variance, 1), 1 / variance[positive].min())
+        return weights @ matrix / weights.sum()
+    if operation == "difference":
+        if len(matrix) < 2:
+            raise ValueError("The difference needs at least two patterns")
+        return matrix[0] - factor * matrix[1:].sum(axis=0)
+    if operation == "normalized mean":
+        # Every pattern is scaled to the mean integrated intensity first
+        area = matrix.sum(axis=1)
+        if (area == 0).any():
+            raise ValueError("A pattern has zero integrated intensity")
+        return (area.mean() / area) @ matrix / len(matrix)
+    raise ValueError("Unknown operation: " + str(operation))
+
+
+PROFILES = ("pseudo-Voigt", "Pearson VII")
+FIT_COLUMNS = ("pattern", "region", "peak", "center", "height", "fwhm", "shape", "area",
+               "center_error", "height_error", "fwhm_error", "shape_error", "rwp", "converged")
+# Shape limits: η of pseudo-Voigt, exponent m of Pearson VII (1 is Lorentzian, large m Gaussian)
+SHAPE_LIMITS = {"pseudo-Voigt": (0.0, 1.0), "Pearson VII": (0.6, 50.0)}
+SHAPE_START = {"pseudo-Voigt": 0.5, "Pearson VII": 2.0}
+LN2 = math.log(2)
+
+
+def profileModel(profile, x, p, count, t, jacobian=True):
+    # count peaks (height, center, FWHM, shape) then the background polynomial in t, for a stack of
+    # patterns. Returns the model and, with jacobian, its analytic derivatives.
+    peaks = numpy.moveaxis(p[..., :4 * count].reshape(p.shape[:-1] + (count, 4)), -1, 0)[..., None]
+    height, center, fwhm, shape = peaks
+    u = 2 * (x[..., None, :] - center) / fwhm
+    u2 = u * u
+    if profile == "pseudo-Voigt":
+        lorentz = 1 / (1 + u2)
+        gauss = numpy.exp(-LN2 * u2)
+        f = shape * lorentz + (1 - shape) * gauss
+    else:
+        k = 2 ** (1 / shape) - 1
+        z = 1 + k * u2
+        f = z ** -shape
+    powers = t[..., None, :] ** numpy.arange(p.shape[-1] - 4 * count)[:, None]
+    y = (height * f).sum(axis=-2) + (p[..., 4 * count:, None] * powers).sum(axis=-2)
+    if not jacobian:
+        return y
+    if profile == "pseudo-Voigt":
+        df_du = -2 * u * (shape * lorentz * lorentz + (1 - shape) * LN2 * gauss)
+        df_ds = lorentz - gauss
+    else:
+        df_du = -2 * shape * k * u * f / z
+        df_ds = -f * (numpy.log(z) - u2 * (k + 1) * LN2 / (shape * z))
+    derivatives = numpy.stack((f, height * df_du * (-2 / fwhm), height * df_du * (-u / fwhm), height * df_ds), axis=-2)
+    derivatives = derivatives.reshape(derivatives.shape[:-3] + (4 * count, derivatives.shape[-1]))
+    powers = numpy.broadcast_to(powers, derivatives.shape[:-2] + powers.shape[-2:])
+    return y, numpy.swapaxes(numpy.concatenate((derivatives, powers), axis=-2), -1, -2)
+
+
+def profileArea(profile, height, fwhm, shape):
+    if profile == "pseudo-Voigt":
+        return height * fwhm / 2 * (shape * math.pi + (1 - shape) * math.sqrt(math.pi / LN2))
+    k = 2 ** (1 / shape) - 1
+    return height * fwhm * math.sqrt(math.pi) * math.exp(math.lgamma(shape - 0.5) - math.lgamma(shape)) / (2 * math.sqrt(k))
+
+
+def batchInverse(matrices):
+    try:
+        return numpy.linalg.inv(matrices)
+    except numpy.linalg.LinAlgError:
+        return numpy.linalg.pinv(matrices)
+
+
+def levenbergMarquardt(func, p, y, weights, lower, upper, iterations=200, tolerance=1e-6):
+    # Batched weighted least squares: every row of p is a problem with its own damping, and
+    # func(p, rows, jacobian) evaluates only the rows still running
+    p = p.copy()
+    rows = numpy.arange(len(p))
+    model, jacobian = func(p, rows)
+    r = y - model
+    chi2 = (weights * r * r).sum(axis=-1)
+    damping = numpy.full(len(p), 1e-3)
+    converged = numpy.zeros(len(p), dtype=bool)
+    counts = numpy.zeros(len(p), dtype=numpy.intp)
+    alpha = numpy.zeros(p.shape + p.shape[-1:])
+    identity = numpy.eye(p.shape[-1])
+    for it in range(iterations):
+        if not len(rows):
+            break
+        jw = numpy.swapaxes(jacobian * weights[rows][..., None], -1, -2)
+        alpha[rows] = jw @ jacobian
+        beta = (jw @ r[..., None])[..., 0]
+        scale = numpy.maximum(numpy.diagonal(alpha[rows], axis1=-2, axis2=-1), 1e-12)
+        step = (batchInverse(alpha[rows] + (damping[rows, None] * scale)[..., None] * identity) @ beta[..., None])[..., 0]
+        trial = numpy.clip(p[rows] + step, lower[rows], upper[rows])
+        r_trial = y[rows] - func(trial, rows, False)
+        chi2_trial = (weights[rows] * r_trial * r_trial).sum(axis=-1)
+        better = chi2_trial <= chi2[rows]
+        small = (chi2[rows] - chi2_trial <= tolerance * chi2_trial) | \
+            (numpy.abs(trial - p[rows]) <= tolerance * (numpy.abs(p[rows]) + tolerance)).all(axis=-1)
+        counts[rows] += 1
+        p[rows[better]] = trial[better]
+        chi2[rows[better]] = chi2_trial[better]
+        damping[rows] = numpy.where(better, numpy.maximum(damping[rows] / 10, 1e-12), damping[rows] * 10)
+        stop = (better & small) | (~better & (damping[rows] > 1e12))
+        converged[rows[stop]] = True
+        # A rejected step leaves the Jacobian as it was
+        keep = ~stop
+        refresh = better[keep]
+        rows, jacobian, r = rows[keep], jacobian[keep], r[keep]
+        if refresh.any():
+            model, jacobian[refresh] = func(p[rows[refresh]], rows[refresh])
+            r[refresh] = y[rows[refresh]] - model
+    return p, alpha, chi2, counts, converged
+
+
+def fitPatterns(patterns, lo, hi, profile="pseudo-Voigt", count=1, order=1, min_height=0.05):
+    # count peaks plus a background polynomial in lo..hi of every pattern, all fitted together with
+    # Poisson weights. Returns one result per pattern, or its error message.
+    if profile not in PROFILES:
+        raise ValueError("Unknown profile: " + profile)
+    shape_low, shape_high = SHAPE_LIMITS[profile]
+    results = [None] * len(patterns)
+    regions = []
+    for index, (x, y) in enumerate(patterns):
+        x = numpy.asarray(x, dtype=numpy.float64)
+        y = numpy.asarray(y, dtype=numpy.float64)
+        mask = (x >= lo) & (x <= hi) & numpy.isfinite(y)
+        order_x = numpy.argsort(x[mask], kind="stable")
+        x = x[mask][order_x]
+        y = y[mask][order_x]
+        if len(x) < 4 * count + order + 2:
+            results[index] = "Too few points in %g..%g" % (lo, hi)
+        elif not y.max() > y.min():
+            results[index] = "No peaks in %g..%g" % (lo, hi)
+        else:
+            regions.append((index, x, y))
+    if not regions:
+        return results
+
+    size = max(len(x) for index, x, y in regions)
+    X = numpy.empty((len(regions), size))
+    Y = numpy.zeros((len(regions), size))
+    W = numpy.zeros((len(regions), size))
+    T = numpy.empty((len(regions), size))
+    P = numpy.empty((len(regions), 4 * count + order + 1))
+    lower = numpy.empty_like(P)
+    upper = numpy.empty_like(P)
+    tables = findPeaks([(x, y) for index, x, y in regions], 1.0, min_height)
+    for row, ((index, x, y), table) in enumerate(zip(regions, tables)):
+        n = len(x)
+        X[row, :n] = x
+        X[row, n:] = x[-1]
+        Y[row, :n] = y
+        W[row, :n] = 1 / numpy.maximum(y, 1.0)
+        T[row] = (X[row] - (x[0] + x[-1]) / 2) / max((x[-1] - x[0]) / 2, 1e-12)
+        step = float(numpy.median(numpy.diff(x))) or 1e-3
+        width = x[-1] - x[0]
+
+        base = float(y.min())
+        table = table[numpy.argsort(-table[:, 1], kind="stable")][:1]
+        fwhm = numpy.clip(numpy.where(table[:, 2] > 0, table[:, 2], width / (4 * count)), 2 * step, width)
+        peaks = [[max(h - base, 1e-9), c, w, SHAPE_START[profile]] for (c, h), w in zip(table[:, :2], fwhm)]
+        while len(peaks) < count:
+            start = numpy.array(sum(peaks, []) + [base] + [0.0] * order)
+            residual = y - profileModel(profile, x, start, len(peaks), T[row, :n], False)
+            top = int((residual * numpy.sqrt(W[row, :n])).argmax())
+            if not peaks or residual[top] > 3 * numpy.sqrt(max(y[top], 1.0)):
+                w = float(numpy.median([it[2] for it in peaks])) if peaks else width / (4 * count)
+                peaks.append([max(residual[top], 1e-9), x[top], w, SHAPE_START[profile]])
+            else:
+                # Nothing left above the noise: the widest peak is taken for two overlapping ones
+                h, c, w, eta = peaks.pop(int(numpy.argmax([it[2] for it in peaks])))
+                peaks += [[h, max(c - w / 4, x[0]), max(w / 2, 2 * step), eta], [h, min(c + w / 4, x[-1]), max(w / 2, 2 * step), eta]]
+        P[row] = sum(peaks, []) + [base] + [0.0] * order
+        lower[row] = [0.0, x[0], step, shape_low] * count + [-numpy.inf] * (order + 1)
+        upper[row] = [numpy.inf, x[-1], width, shape_high] * count + [numpy.inf] * (order + 1)
+
+    P, alpha, chi2, iterations, converged = levenbergMarquardt(
+        lambda p, rows, jacobian=True: profileModel(profile, X[rows], p, count, T[rows], jacobian), P, Y, W, lower, upper)
+    fit = profileModel(profile, X, P, count, T, False)
+    covariance = batchInverse(alpha)
+    for row, (index, x, y) in enumerate(regions):
+        n = len(x)
+        freedom = max(n - P.shape[1], 1)
+        errors = numpy.sqrt(numpy.abs(numpy.diagonal(covariance[row]) * chi2[row] / freedom))
+        peaks = P[row, :4 * count].reshape(count, 4)
+        # Peaks in the order of 2θ
+        order_peaks = numpy.argsort(peaks[:, 1], kind="stable")
+        results[index] = {
+            'peaks': peaks[order_peaks],
+            'errors': errors[:4 * count].reshape(count, 4)[order_peaks],
+            'area': numpy.array([profileArea(profile, *it[[0, 2, 3]]) for it in peaks[order_peaks]]),
+            'background': P[row, 4 * count:],
+            'x': x,
+            'y': y,
+            'fit': fit[row, :n],
+            'rwp': float(numpy.sqrt(chi2[row] / (W[row] * Y[row] * Y[row]).sum())),
+            'iterations': int(iterations[row]),
+            'converged': bool(converged[row]),
+        }
+    return results
+
+
+def fitTable(results, rows):
+    # rows: (pattern, region) numbers of the results; one row per fitted peak
+    table = []
+    for (pattern, region), result in zip(rows, results):
+        if isinstance(result, str):
+            continue
+        for number, (peak, error, area) in enumerate(zip(result['peaks'], result['errors'], result['area']), 1):
+            height, center, fwhm, shape = peak
+            table.append((pattern, region, number, center, height, fwhm, shape, area, error[1], error[0], error[2], error[3],
+                          result['rwp'], result['converged']))
+    return numpy.array(table, dtype=numpy.float64).reshape(-1, len(FIT_COLUMNS))
+
+
+class Dataset:
+    # The arrays of one pattern and where they came from. Rows past count are
+    # not filled yet (streamed and followed files grow in place).
+    def __init__(self, id, name, columns, names, meta=None, count=None):
+        self.id = id
+        self.name = name
+        self.names = tuple(names)
+        self.meta = dict(meta or {})
+        self.revision = 0
+        # Revision of the last change that was not a plain append
+        self.replaced = 0
+        self.columns = [numpy.asarray(column, dtype=numpy.float64) for column in columns]
+        self.count = len(self.columns[0]) if count is None else count
+
+    def data(self):
+        return [column[:self.count] for column in self.columns]
+
+    def replace(self, columns, count=None):
+        self.columns = [numpy.asarray(column, dtype=numpy.float64) for column in columns]
+        self.count = len(self.columns[0]) if count is None else count
+        self.revision += 1
+        self.replaced = self.revision
+
+    def extend(self, count, columns=None):
+        # Rows below the old count must be unchanged in the new columns
+        if columns is not None:
+            self.columns = [numpy.asarray(column, dtype=numpy.float64) for column in columns]
+        self.count = count
+        self.revision += 1
+
+
+class DatasetStore:
+    # Every pattern is held once; views keep the id and share the arrays
+    def __init__(self):
+        self.datasets = {}
+        self.next_id = 1
+
+    def add(self, name, columns, names=("two_theta", "intensity"), meta=None, count=None):
+        dataset = Dataset(self.next_id, name, columns, names, meta, count)
+        self.datasets[dataset.id] = dataset
+        self.next_id += 1
+        return dataset
+
+    def get(self, id):
+        return self.datasets[id]
+
+    def remove(self, id):
+        self.datasets.pop(id, None)
+
+    def __contains__(self, id):
+        return id in self.datasets
+
+    def __len__(self):
+        return len(self.datasets)
+
+    def __iter__(self):
+        return iter(self.datasets.values())
+
+
+class StageCache:
+    # Results of processing stages, least recently used first
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+
+    def get(self, key, compute):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        value = compute()
+        self.entries[key] = value
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return value
+
+
+class PatternCache:
+    # Converted patterns as .npy files named after a hash of the file and the parameters
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, file_name, *params):
+        h = hashlib.blake2b(digest_size=20)
+        with open(file_name, "rb") as f:
+            while True:
+                block = f.read(1 << 20)
+                if not block:
+                    break
+                h.update(block)
+        h.update(repr(params).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            data = numpy.load(path, mmap_mode="r")
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return data[0], data[1]
+
+    def put(self, key, two_theta, intensity):
+        path = self.path(key)
+        tmp = path + "." + str(os.getpid()) + "." + str(id(two_theta)) + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                numpy.save(f, numpy.vstack((two_theta, intensity)))
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for it in os.scandir(self.directory):
+            if it.name.endswith(".npy"):
+                try:
+                    st = it.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, it.path))
+        total = sum(it[1] for it in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for it in os.scandir(self.directory):
+            if it.name.endswith(".npy"):
+                try:
+                    os.remove(it.path)
+                except OSError:
+                    pass
+
+
+class ProfileStage:
+    # Times one operation; rows may be set inside the with block once known
+    def __init__(self, profiler, name, rows, info):
+        self.profiler = profiler
+        self.name = name
+        self.rows = rows
+        self.info = info
+
+    def __enter__(self):
+        self.memory = self.profiler.enterMemory()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        peak = self.profiler.exitMemory(self.memory)
+        self.profiler.record(self.name, seconds, self.rows, peak, self.info)
+        return False
+
+
+class NullStage:
+    # Shared by every stage while profiling is off
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Profiler:
+    # Wall time, rows and peak traced memory per operation; while disabled stage() costs next to nothing
+    def __init__(self, max_records=1000):
+        self.enabled = False
+        self.records = collections.deque(maxlen=max_records)
+        self.listeners = []
+        self.log = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def configure(self, enabled, log_file=None):
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+            if enabled and log_file:
+                self.log = open(log_file, "a", encoding="utf-8")
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.enabled = enabled
+
+    def stage(self, name, rows=None, **info):
+        if not self.enabled:
+            return NULL_STAGE
+        return ProfileStage(self, name, rows, info)
+
+    def enterMemory(self):
+        if not tracemalloc.is_tracing():
+            return None
+        stack = self.local.__dict__.setdefault("stack", [])
+        current, peak = tracemalloc.get_traced_memory()
+        # Keep the peak the enclosing stage reached before it is reset
+        if stack:
+            stack[-1][1] = max(stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        entry = [current, current]
+        stack.append(entry)
+        return entry
+
+    def exitMemory(self, entry):
+        if entry is None or not tracemalloc.is_tracing():
+            return None
+        stack = self.local.stack
+        peak = max(entry[1], tracemalloc.get_traced_memory()[1])
+        if entry in stack:
+            stack.remove(entry)
+        if stack:
+            stack[-1][1] = max(stack[-1][1], peak)
+        return peak - entry[0]
+
+    def record(self, name, seconds, rows=None, peak=None, info=None):
+        item = {
+            "time": time.time(),
+            "stage": name,
+            "seconds": seconds,
+            "rows": rows,
+            "peak_bytes": peak,
+            "thread": threading.current_thread().name,
+        }
+        if info:
+            item.update(info)
+        with self.lock:
+            self.records.append(item)
+            if self.log is not None:
+                self.log.write(json.dumps(item, default=jsonDefault) + "\n")
+                self.log.flush()
+        for listener in list(self.listeners):
+            listener(item)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+
+PROFILER = Profiler()
+
+
+def saveColumns(file, columns, names, delimiter):
+    extension = os.path.splitext(file)[1].lower()
+    if extension == ".npy":
+        numpy.save(file, numpy.column_stack(columns))
+    elif extension == ".npz":
+        numpy.savez(file, **dict(zip(names, columns)))
+    elif extension == ".bin":
+        # Fixed-width little-endian float64, one row after another
+        numpy.column_stack(columns).astype("<f8").tofile(file)
+    elif all(it.dtype.kind in "iu" or it.dtype == numpy.float64 and not numpy.isnan(it).any() for it in columns):
+        writeText(file, columns, names, delimiter)
+    else:
+        import pandas
+
+        data = pandas.DataFrame(dict(zip(names, columns)))
+        data.to_csv(file, index=False, sep=delimiter, header=True)
+
+
+def writeText(file, columns, names, delimiter, chunk_size=STREAM_CHUNK_SIZE):
+    # Same output as DataFrame.to_csv (shortest repr of every value), without building a DataFrame
+    with open(file, "w", newline="") as f:
+        f.write(delimiter.join(names) + "\n")
+        for start in range(0, len(columns[0]), chunk_size):
+            rows = zip(*[map(repr, it[start:start + chunk_size].tolist()) for it in columns])
+            f.write("\n".join(map(delimiter.join, rows)) + "\n")
+
+
+def saveTable(file, two_theta, intensity, delimiter):
+    saveColumns(file, (two_theta, intensity), ("two_theta", "intensity"), delimiter)
+
+
+def convertToTable(file_name, out_file, separator, min_A, max_A, delimiter, calibration=None):
+    two_theta, intensity = convertFile(file_name, separator, min_A, max_A, calibration)
+    saveTable(out_file, two_theta, intensity, delimiter)
+    return out_file
+
+
+def alignUp(size, alignment=SESSION_ALIGN):
+    return -(-size // alignment) * alignment
+
+
+def jsonDefault(value):
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError("Cannot store " + type(value).__name__ + " in a session")
+
+
+def writeSession(file_name, header, arrays):
+    # Magic, version, JSON header, then every array as little-endian float64 on a 64-byte boundary
+    arrays = [numpy.ascontiguousarray(it, dtype="<f8") for it in arrays]
+    entries = []
+    offset = 0
+    for array in arrays:
+        entries.append([offset, len(array)])
+        offset += alignUp(array.nbytes)
+    header = dict(header, arrays=entries)
+    text = json.dumps(header, default=jsonDefault).encode("utf-8")
+    start = alignUp(len(SESSION_MAGIC) + 12 + len(text))
+    temp = file_name + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(SESSION_MAGIC)
+        f.write(struct.pack("<IQ", SESSION_VERSION, len(text)))
+        f.write(text)
+        for array, (offset, length) in zip(arrays, entries):
+            f.write(bytes(start + offset - f.tell()))
+            f.write(memoryview(array).cast("B"))
+    os.replace(temp, file_name)
+
+
+def readSession(file_name):
+    # The arrays are read-only views of a single memory map of the file
+    with open(file_name, "rb") as f:
+        if f.read(len(SESSION_MAGIC)) != SESSION_MAGIC:
+            raise ValueError(file_name + " is not a FishX session")
+        version, length = struct.unpack("<IQ", f.read(12))
+        if version > SESSION_VERSION:
+            raise ValueError("Session version " + str(version) + " is not supported")
+        header = json.loads(f.read(length).decode("utf-8"))
+    start = alignUp(len(SESSION_MAGIC) + 12 + length)
+    entries = header.pop("arrays")
+    size = max((offset + length * 8 for offset, length in entries), default=0)
+    data = numpy.memmap(file_name, dtype=numpy.uint8, mode="r", offset=start, shape=(size,)) if size else numpy.empty(0, numpy.uint8)
+    arrays = [data[offset:offset + length * 8].view("<f8") for offset, length in entries]
+    return header, arrays
+
+
+def sessionMapping(array):
+    # The memory map of the session file an array of readSession is a view of
+    while isinstance(array, numpy.ndarray):
+        array = array.base
+    return array if isinstance(array, mmap.mmap) else None
+
+
+def readCard(file_name):
+    # One reflection per line, d (Å) and intensity; "# name:" and "# formula:" lines name the phase
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    formula = ""
+    d = []
+    intensity = []
+    with open(file_name, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#"):
+                key, sep, value = line[1:].partition(":")
+                key = key.strip().lower()
+                if sep and key == "name":
+                    name = value.strip()
+                elif sep and key == "formula":
+                    formula = value.strip()
+                continue
+            fields = line.replace(",", " ").replace(";", " ").split()
+            if not fields:
+                continue
+            try:
+                value = float(fields[0])
+                height = float(fields[1]) if len(fields) > 1 else 100.0
+            except ValueError:
+                continue
+            if value > 0:
+                d.append(value)
+                intensity.append(height)
+    return name, formula, d, intensity
+
+
+class ReferenceLibrary:
+    # All reflections sorted by d, with their intensity (100 for the strongest of a card) and card
+    def __init__(self, cards, d, intensity, card):
+        self.cards = cards
+        self.d = d
+        self.intensity = intensity
+        self.card = card
+
+    def __len__(self):
+        return len(self.cards)
+
+    @classmethod
+    def compile(cls, files):
+        cards = []
+        d = []
+        intensity = []
+        card = []
+        for file_name in files:
+            name, formula, lines, heights = readCard(file_name)
+            if not lines:
+                continue
+            heights = numpy.asarray(heights, dtype=numpy.float64)
+            top = heights.max()
+            d.append(numpy.asarray(lines, dtype=numpy.float64))
+            intensity.append(heights * (100.0 / top) if top > 0 else numpy.full(len(heights), 100.0))
+            card.append(numpy.full(len(lines), len(cards), dtype=numpy.intp))
+            cards.append({'name': name, 'formula': formula, 'file': os.path.basename(file_name)})
+        if not cards:
+            return cls(cards, numpy.empty(0), numpy.empty(0), numpy.empty(0, numpy.intp))
+        d = numpy.concatenate(d)
+        order = numpy.argsort(d, kind="stable")
+        return cls(cards, d[order], numpy.concatenate(intensity)[order], numpy.concatenate(card)[order])
+
+    def sticks(self, index, wavelength):
+        # 2θ and intensity of the reflections of one card that the wavelength reaches
+        mask = (self.card == index) & (self.d > wavelength / 2)
+        return 2 * numpy.degrees(numpy.arcsin(wavelength / (2 * self.d[mask]))), self.intensity[mask]
+
+    def search(self, two_theta, intensity, wavelength, tolerance=0.1, candidates=20):
+        # Score: share of the observed intensity explained times share of the card's lines matched
+        two_theta = numpy.asarray(two_theta, dtype=numpy.float64)
+        weights = numpy.clip(numpy.asarray(intensity, dtype=numpy.float64), 0, None)
+        valid = (two_theta > 2 * tolerance) & (two_theta < 180 - 2 * tolerance)
+        two_theta = two_theta[valid]
+        weights = weights[valid]
+        if not len(two_theta) or not len(self.d) or weights.sum() <= 0:
+            return []
+        weights = weights / weights.sum()
+        low = dSpacing(two_theta + tolerance, wavelength)
+        high = dSpacing(two_theta - tolerance, wavelength)
+        start = numpy.searchsorted(self.d, low, "left")
+        stop = numpy.searchsorted(self.d, high, "right")
+        counts = stop - start
+        total = int(counts.sum())
+        if not total:
+            return []
+        peaks = len(two_theta)
+        # Indices of all matched reflections, peak by peak, without a Python loop
+        first = numpy.cumsum(counts) - counts
+        line = numpy.arange(total) - numpy.repeat(first - start, counts)
+        peak = numpy.repeat(numpy.arange(peaks), counts)
+        card = self.card[line]
+        count = len(self.cards)
+        # Every peak is counted once per card, however many lines it hits
+        pair = numpy.unique(card * peaks + peak)
+        explained = numpy.bincount(pair // peaks, weights=weights[pair % peaks], minlength=count)
+        line = numpy.unique(line)
+        matched = numpy.bincount(self.card[line], weights=self.intensity[line], minlength=count)
+        lo = numpy.searchsorted(self.d, low.min(), "left")
+        hi = numpy.searchsorted(self.d, high.max(), "right")
+        expected = numpy.bincount(self.card[lo:hi], weights=self.intensity[lo:hi], minlength=count)
+        share = numpy.divide(matched, expected, out=numpy.zeros(count), where=expected > 0)
+        score = explained * share
+        top = min(candidates, count)
+        best = numpy.argpartition(-score, top - 1)[:top]
+        best = best[numpy.argsort(-score[best], kind="stable")]
+        result = []
+        for index in best:
+            if score[index] <= 0:
+                break
+            result.append(dict(self.cards[index], card=int(index), score=float(score[index]),
+                               explained=float(explained[index]), matched=float(share[index])))
+        return result
+
+
+def referenceFiles(directory=REFERENCE_DIRECTORY):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(it.path for it in os.scandir(directory) if it.is_file() and os.path.splitext(it.name)[1].lower() in REFERENCE_EXTENSIONS)
+
+
+def referenceStamp(files):
+    # Name, modification time and size of every card file
+    stamp = []
+    for file_name in files:
+        status = os.stat(file_name)
+        stamp.append([os.path.basename(file_name), status.st_mtime_ns, status.st_size])
+    return stamp
+
+
+def loadReferences(directory=REFERENCE_DIRECTORY):
+    # Compiled into REFERENCE_INDEX and memory-mapped; rebuilt when a card file changes
+    files = referenceFiles(directory)
+    stamp = referenceStamp(files)
+    index = os.path.join(directory, REFERENCE_INDEX)
+    if os.path.isfile(index):
+        try:
+            header, arrays = readSession(index)
+            if header.get("files") == stamp:
+                return ReferenceLibrary(header["cards"], arrays[0], arrays[1], arrays[2].astype(numpy.intp))
+        except (OSError, ValueError, KeyError, IndexError):
+            pass
+    library = ReferenceLibrary.compile(files)
+    if files:
+        try:
+            writeSession(index, {'type': "references", 'files': stamp, 'cards': library.cards}, [library.d, library.intensity, library.card])
+        except OSError:
+            # A read-only library is searched without the index and compiled again next time
+            pass
+    return library
+
+
+def renderFigure(file_name, spec, dpi=300, rasterize=False):
+    # Runs in worker processes, without Qt
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=spec['size'], dpi=spec['dpi'])
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(111)
+    axes.set_xlabel(spec['xlabel'])
+    axes.set_ylabel(spec['ylabel'])
+    x_min, x_max = spec['xlim']
+    # About two samples per output pixel, as on screen
+    buckets = max(int(axes.bbox.width * dpi / spec['dpi']), 100)
+    if 'series' in spec:
+        axes.get_yaxis().set_ticks([])
+        for key, x, y, monotonic, style in spec['series']:
+            if monotonic:
+                x, y = decimate(x, y, x_min, x_max, buckets)
+            # Rasterized lines keep vector files small when patterns have many points
+            axes.plot(x, y, label=key, rasterized=rasterize, **style)
+    else:
+        renderSeries(figure, axes, spec, buckets, rasterize)
+    axes.set_xlim(x_min, x_max)
+    axes.set_ylim(*spec['ylim'])
+    figure.savefig(file_name, dpi=dpi)
+    return file_name
+
+
+def renderSeries(figure, axes, spec, buckets, rasterize=False):
+    # Heat map or waterfall of a series window, binned to the output resolution
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import LogNorm, Normalize
+
+    axes.set_yticks(spec['yticks'])
+    axes.set_yticklabels(spec['yticklabels'])
+    grid, matrix, values = spec['grid'], spec['matrix'], spec['values']
+    if matrix is None or len(grid) == 0:
+        return
+    lo, hi = gridWindow(grid, *spec['xlim'])
+    if hi <= lo:
+        return
+    if spec['mode'] == "heatmap":
+        if spec['log']:
+            positive = matrix[matrix > 0]
+            norm = LogNorm(positive.min(), positive.max()) if len(positive) else LogNorm()
+        else:
+            norm = Normalize(matrix.min(), matrix.max())
+        start, low, high = binColumns(matrix, lo, hi, buckets)
+        artist = axes.imshow(high, origin='lower', aspect='auto', interpolation='nearest', norm=norm,
+                             extent=(grid[lo], grid[hi - 1], -0.5, len(matrix) - 0.5))
+    else:
+        artist = LineCollection(waterfallSegments(grid, matrix, lo, hi, buckets // 2, spec['step']), linewidths=0.8, cmap='viridis',
+                                norm=Normalize(values.min(), values.max()), rasterized=rasterize)
+        artist.set_array(values)
+        axes.add_collection(artist)
+    figure.colorbar(artist, ax=axes).set_label(spec['clabel'])
+
+
+def parseSeparator(text):
+    if text in ("\\t", "tab"):
+        return "\t"
+    if text == "space":
+        return " "
+    return text
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(prog="fishx", description="Analysis of diffraction data from digital multimeter data")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    parserConvert = commands.add_parser("convert", help="convert multimeter logs into 2θ/intensity tables")
+    parserConvert.add_argument("files", nargs="+", help="multimeter log files (glob patterns are expanded)")
+    parserConvert.add_argument("--start", type=float, required=True, help="2θ start")
+    parserConvert.add_argument("--end", type=float, required=True, help="2θ end")
+    parserConvert.add_argument("--sep", default=",", help="separator of the input files (default: ',')")
+    parserConvert.add_argument("--delimiter", default=",", help="separator of the output tables (default: ',')")
+    parserConvert.add_argument("--ext", default=".dat", help="extension of the output tables (default: .dat)")
+    parserConvert.add_argument("-o", "--output", default=".", help="output directory (default: current directory)")
+    parserConvert.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes (default: number of CPUs)")
+    parserConvert.add_argument("--calibration", default=DEFAULT_CALIBRATION, help="calibration profile (default: " + DEFAULT_CALIBRATION + ")")
+    parserConvert.add_argument("--calibrations", default=CALIBRATION_FILE, help="file of calibration profiles (default: calibrations.json next to fishx.py)")
+
+    args = parser.parse_args(argv)
+
+    profiles = loadCalibrations(args.calibrations)
+    if args.calibration not in profiles:
+        parser.error("unknown calibration profile " + repr(args.calibration) + " (known: " + ", ".join(profiles) + ")")
+    calibration = profiles[args.calibration].compile()
+
+    files = []
+    for it in args.files:
+        files.extend(sorted(glob.glob(it)) if glob.has_magic(it) else [it])
+    os.makedirs(args.output, exist_ok=True)
+    separator = parseSeparator(args.sep)
+    delimiter = parseSeparator(args.delimiter)
+
+    # Forked workers do not re-import the calling script (fishx.py) with its GUI stack
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+
+    errors = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, args.jobs), mp_context=context) as pool:
+        futures = {}
+        for file_name in files:
+            out_file = os.path.join(args.output, os.path.splitext(os.path.basename(file_name))[0] + args.ext)
+            futures[pool.submit(convertToTable, file_name, out_file, separator, args.start, args.end, delimiter, calibration)] = file_name
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                print(future.result())
+            except Exception:
+                errors += 1
+                print(futures[future] + ": " + traceback.format_exc().splitlines()[-1], file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+# Matplotlib canvases of the plot windows; imported when the first plot is built, matplotlib is slow to import
+
+import numpy
+
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LogNorm, Normalize
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
+
+import fishcore
+
+
+class NavigationToolbar(NavigationToolbar2QT):
+    toolitems = [t for t in NavigationToolbar2QT.toolitems if t[0] in ('Pan', 'Zoom', 'Subplots', 'Customize', 'Save')]
+
+
+class plotCanvas(FigureCanvas):
+    def __init__(self, parent=None, width=5, height=4, dpi=100):
+        self.fig = Figure(figsize=(width, height), dpi=dpi)
+        self.axes = self.fig.add_subplot(111)
+
+        self.compute_initial_figure()
+
+        super().__init__(self.fig)
+        self.setParent(parent)
+
+        super().updateGeometry()
+
+    def compute_initial_figure(self):
+        pass
+
+
+class PlotCanvas(plotCanvas):
+    def __init__(self, *args, **kwargs):
+        self.series = {}
+        self.styles = {}
+        self.background = None
+        self.resolution = 1
+        plotCanvas.__init__(self, *args, **kwargs)
+
+        self.axes.set_xlabel("2θ, °")
+        self.axes.set_ylabel("Intensity")
+        self.axes.get_yaxis().set_ticks([])
+
+        self.axes.callbacks.connect('xlim_changed', self.slot_limitsChanged)
+        self.mpl_connect('resize_event', self.slot_limitsChanged)
+        self.mpl_connect('draw_event', self.slot_drawn)
+
+    def compute_initial_figure(self):
+        pass
+
+    def add_series(self, key, x, y, redraw=True, **style):
+        # Lines are animated artists blitted over a cached background of the axes
+        if key in self.series:
+            self.update_series(key, x, y, redraw)
+            return self.series[key][0]
+        x = numpy.asarray(x, dtype=numpy.float64)
+        y = numpy.asarray(y, dtype=numpy.float64)
+        # Styled series (markers) are few points and are never decimated
+        series = [None, x, y, not style and fishcore.isSorted(x)]
+        line, = self.axes.plot(*self.decimated(series, *self.data_limits(x)), animated=True, label=key, **style)
+        series[0] = line
+        self.series[key] = series
+        if style:
+            self.styles[key] = style
+        if redraw:
+            self.redraw(True)
+        return line
+
+    def update_series(self, key, x, y, redraw=True):
+        series = self.series[key]
+        series[1] = numpy.asarray(x, dtype=numpy.float64)
+        series[2] = numpy.asarray(y, dtype=numpy.float64)
+        series[3] = series[3] and fishcore.isSorted(series[1])
+        series[0].set_data(*self.decimated(series, *self.data_limits(series[1])))
+        if redraw:
+            self.redraw(True)
+
+    def remove_series(self, key, redraw=True):
+        self.series.pop(key)[0].remove()
+        self.styles.pop(key, None)
+        if redraw:
+            self.redraw(True)
+
+    def set_seriesVisible(self, key, visible):
+        self.series[key][0].set_visible(visible)
+        self.redraw(True)
+
+    def clear_series(self):
+        for key in list(self.series):
+            self.remove_series(key, False)
+        self.axes.set_prop_cycle(None)
+
+    def redraw(self, rescale):
+        if rescale:
+            limits = (self.axes.get_xlim(), self.axes.get_ylim())
+            self.axes.relim(visible_only=True)
+            self.axes.autoscale_view()
+            if limits != (self.axes.get_xlim(), self.axes.get_ylim()):
+                self.refresh_series()
+                self.draw_idle()
+                return
+        self.blit_series()
+
+    def draw(self):
+        with fishcore.PROFILER.stage("plot draw", series=len(self.series)) as stage:
+            super().draw()
+            stage.rows = self.drawn_points()
+
+    def blit_series(self):
+        if self.background is None:
+            self.draw_idle()
+            return
+        with fishcore.PROFILER.stage("plot blit", series=len(self.series)) as stage:
+            self.restore_region(self.background)
+            self.draw_series()
+            self.blit(self.figure.bbox)
+            stage.rows = self.drawn_points()
+
+    def drawn_points(self):
+        if not fishcore.PROFILER.enabled:
+            return None
+        return sum(len(series[0].get_xdata()) for series in self.series.values() if series[0].get_visible())
+
+    def draw_series(self):
+        for series in self.series.values():
+            self.axes.draw_artist(series[0])
+
+    def slot_drawn(self, event):
+        # Saving draws the animated lines itself, at another size or on
+        # another canvas (SVG, PDF); only screen draws give the background
+        if event.canvas is not self or self.is_saving():
+            return
+        self.background = self.copy_from_bbox(self.figure.bbox)
+        self.draw_series()
+
+    def data_limits(self, x):
+        if len(x) == 0:
+            return 0, 0
+        return x[0], x[-1]
+
+    def decimated(self, series, x_min, x_max):
+        line, x, y, monotonic = series
+        if not monotonic:
+            return x, y
+        buckets = max(int(self.axes.bbox.width * self.resolution), 100)
+        return fishcore.decimate(x, y, x_min, x_max, buckets)
+
+    def refresh_series(self):
+        x_min, x_max = self.axes.get_xlim()
+        for series in self.series.values():
+            series[0].set_data(*self.decimated(series, x_min, x_max))
+
+    def slot_limitsChanged(self, *args):
+        # Only the samples of the visible 2θ range are drawn, about two per pixel
+        self.refresh_series()
+
+    def get_Spec(self):
+        series = []
+        for key, (line, x, y, monotonic) in self.series.items():
+            if line.get_visible():
+                style = {'color': line.get_color(), 'linestyle': line.get_linestyle(), 'linewidth': line.get_linewidth(), 'marker': line.get_marker()}
+                series.append((key, x, y, monotonic, style))
+        return {'size': tuple(self.figure.get_size_inches()), 'dpi': self.figure.dpi, 'xlim': self.axes.get_xlim(), 'ylim': self.axes.get_ylim(),
+                'xlabel': self.axes.get_xlabel(), 'ylabel': self.axes.get_ylabel(), 'series': series}
+
+    def print_figure(self, *args, **kwargs):
+        dpi = kwargs.get('dpi')
+        self.resolution = dpi / self.figure.dpi if isinstance(dpi, (int, float)) else 1
+        self.refresh_series()
+        try:
+            super().print_figure(*args, **kwargs)
+        finally:
+            self.resolution = 1
+            self.refresh_series()
+            # The renderer may have been replaced by the print; draw anew before blitting
+            self.background = None
+
+    def update_figure(self, data, key=''):
+        self.clear_series()
+        self.add_series(key, data[0], data[1], False)
+        self.redraw(True)
+
+    def update_serialFigure(self, listData, keys=None):
+        self.clear_series()
+        if keys is None:
+            keys = [str(it) for it in range(len(listData))]
+        for key, data in zip(keys, listData):
+            self.add_series(key, data[0], data[1], False)
+        self.redraw(True)
+
+
+class SeriesCanvas(plotCanvas):
+    # Heat map (one image) or waterfall (one LineCollection), binned to about one column per pixel
+    def __init__(self, *args, **kwargs):
+        self.grid = None
+        self.matrix = None
+        self.values = None
+        self.mode = "heatmap"
+        self.offset = 0.1
+        self.log = False
+        self.artist = None
+        self.colorbar = None
+        self.resolution = 1
+        self.updating = False
+        plotCanvas.__init__(self, *args, **kwargs)
+
+        self.axes.set_xlabel("2θ, °")
+
+        self.axes.callbacks.connect('xlim_changed', self.slot_limitsChanged)
+        self.mpl_connect('resize_event', self.slot_limitsChanged)
+
+    def set_Series(self, grid, matrix, values, label):
+        self.grid = grid
+        self.matrix = matrix
+        self.values = values
+        self.axes.set_ylabel(label)
+        self.rebuild()
+
+    def set_Mode(self, mode, offset=0.1, log=False):
+        self.mode = mode
+        self.offset = offset
+        self.log = log
+        if self.matrix is not None:
+            self.rebuild()
+
+    def rebuild(self):
+        if self.artist is not None:
+            self.artist.remove()
+            self.artist = None
+        rows = len(self.matrix)
+        self.updating = True
+        try:
+            self.axes.set_xlim(self.grid[0], self.grid[-1])
+        finally:
+            self.updating = False
+        if self.mode == "heatmap":
+            self.artist = self.axes.imshow(numpy.zeros((rows, 1)), origin='lower', aspect='auto', interpolation='nearest', norm=self.norm())
+            self.axes.set_ylim(-0.5, rows - 0.5)
+            label = "Intensity"
+        else:
+            self.artist = LineCollection([], linewidths=0.8, cmap='viridis', norm=Normalize(self.values.min(), self.values.max()))
+            self.artist.set_array(self.values)
+            self.axes.add_collection(self.artist)
+            low, high = self.matrix.min(), self.matrix.max()
+            self.axes.set_ylim(low, high + self.step() * max(rows - 1, 0) + 0.05 * (high - low))
+            label = self.axes.get_ylabel()
+        # The colorbar is kept and moved to the new artist; removing it does not give the space back
+        if self.colorbar is None:
+            self.colorbar = self.figure.colorbar(self.artist, ax=self.axes)
+        else:
+            self.colorbar.mappable = self.artist
+            self.artist.colorbar = self.colorbar
+            self.colorbar.update_normal(self.artist)
+        self.colorbar.set_label(label)
+        self.set_Ticks()
+        self.update_artist()
+        self.draw_idle()
+
+    def norm(self):
+        # Non-positive intensities are left blank on the logarithmic scale
+        if self.log:
+            positive = self.matrix[self.matrix > 0]
+            return LogNorm(positive.min(), positive.max()) if len(positive) else LogNorm()
+        return Normalize(self.matrix.min(), self.matrix.max())
+
+    def step(self):
+        return self.offset * float(numpy.median(numpy.ptp(self.matrix, axis=1)))
+
+    def set_Ticks(self):
+        rows = len(self.matrix)
+        positions = numpy.unique(numpy.linspace(0, rows - 1, min(rows, 10)).round().astype(int))
+        if self.mode == "heatmap":
+            self.axes.set_yticks(positions)
+            self.axes.set_yticklabels(["%g" % self.values[it] for it in positions])
+        else:
+            base = float(numpy.median(self.matrix[:, 0])) if self.matrix.shape[1] else 0.0
+            self.axes.set_yticks(base + positions * self.step())
+            self.axes.set_yticklabels(["%g" % self.values[it] for it in positions])
+
+    def update_artist(self):
+        if self.artist is None or len(self.grid) == 0:
+            return
+        x_min, x_max = self.axes.get_xlim()
+        lo, hi = fishcore.gridWindow(self.grid, x_min, x_max)
+        if hi <= lo:
+            return
+        columns = max(int(self.axes.bbox.width * self.resolution), 100)
+        if self.mode == "heatmap":
+            start, low, high = fishcore.binColumns(self.matrix, lo, hi, columns)
+            self.artist.set_data(high)
+            self.artist.set_extent((self.grid[lo], self.grid[hi - 1], -0.5, len(self.matrix) - 0.5))
+        else:
+            self.artist.set_segments(fishcore.waterfallSegments(self.grid, self.matrix, lo, hi, columns // 2, self.step()))
+
+    def slot_limitsChanged(self, *args):
+        if not self.updating:
+            self.update_artist()
+
+    def get_Spec(self):
+        spec = {'size': tuple(self.figure.get_size_inches()), 'dpi': self.figure.dpi, 'xlim': self.axes.get_xlim(), 'ylim': self.axes.get_ylim(),
+                'xlabel': self.axes.get_xlabel(), 'ylabel': self.axes.get_ylabel(), 'mode': self.mode, 'grid': self.grid, 'matrix': self.matrix,
+                'values': self.values, 'yticks': list(self.axes.get_yticks()), 'yticklabels': [it.get_text() for it in self.axes.get_yticklabels()]}
+        if self.matrix is not None:
+            spec['log'] = self.log
+            spec['step'] = self.step()
+            spec['clabel'] = self.colorbar.ax.get_ylabel()
+        return spec
+
+    def print_figure(self, *args, **kwargs):
+        dpi = kwargs.get('dpi')
+        self.resolution = dpi / self.figure.dpi if isinstance(dpi, (int, float)) else 1
+        self.update_artist()
+        try:
+            super().print_figure(*args, **kwargs)
+        finally:
+            self.resolution = 1
+            self.update_artist()
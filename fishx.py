@@ -2,18 +2,48 @@
 
 import sys
 import os
+import re
+import time
 import platform
+import gc
+import importlib
+import threading
 import traceback
+import weakref
+import multiprocessing
+import concurrent.futures
+
+if __name__ == "__main__" and sys.argv[1:2] == ["convert"]:
+    # Headless batch conversion: leave before PySide2 and matplotlib are imported
+    import fishcore
+    sys.exit(fishcore.cli())
+
+PROFILE_STARTUP = "--profile-startup" in sys.argv and __name__ == "__main__"
+STARTUP_CLOCK = time.perf_counter()
+
+
+def startupTime(label, start):
+    now = time.perf_counter()
+    if PROFILE_STARTUP:
+        sys.stderr.write("%9.1f ms  %s\n" % ((now - start) * 1000, label))
+    return now
+
+
+start = time.perf_counter()
 from PySide2 import QtGui, QtCore, QtWidgets
+start = startupTime("import PySide2", start)
 
-import pandas
-import matplotlib
+import numpy
+start = startupTime("import numpy", start)
 
-from matplotlib.pyplot import Figure
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
+import fishcore
+startupTime("import fishcore", start)
+
+WARM_UP_MODULES = ("pandas", "matplotlib.figure", "fishplot")
 
 PROGRAM_PATH = os.path.realpath(os.path.dirname(__file__))
+SERIES_MODES = ("heatmap", "waterfall")
+AUTOSAVE_FILES = ("autosave.fxs", "autosave.1.fxs")
 ResTableWidgetID = 0
 ResPlotWidgetID = 0
 
@@ -45,8 +75,26 @@ class MainWindow(QtWidgets.QMainWindow):
         self.actionExit.setShortcut(QtGui.QKeySequence(QtCore.Qt.CTRL + QtCore.Qt.Key_Q))
         self.actionExit.triggered.connect(self.close)
 
+        self.actionClearCache = QtWidgets.QAction("Clear cache")
+        self.actionClearCache.triggered.connect(self.slot_clearCache)
+
+        self.actionOpenSession = QtWidgets.QAction("Open session")
+        self.actionOpenSession.triggered.connect(self.slot_openSession)
+
+        self.actionSaveSession = QtWidgets.QAction("Save session")
+        self.actionSaveSession.triggered.connect(self.slot_saveSession)
+
+        self.actionRestoreSession = QtWidgets.QAction("Restore last session")
+        self.actionRestoreSession.triggered.connect(self.slot_restoreSession)
+
         self.menuFile.addAction(self.actionOpenFile)
         self.menuFile.addSeparator()
+        self.menuFile.addAction(self.actionOpenSession)
+        self.menuFile.addAction(self.actionSaveSession)
+        self.menuFile.addAction(self.actionRestoreSession)
+        self.menuFile.addSeparator()
+        self.menuFile.addAction(self.actionClearCache)
+        self.menuFile.addSeparator()
         self.menuFile.addAction(self.actionExit)
 
         self.menuTable = QtWidgets.QMenu("&Table")
@@ -82,11 +130,52 @@ class MainWindow(QtWidgets.QMainWindow):
         self.actionBuildSubPlots.setIcon(QtGui.QIcon(PROGRAM_PATH + "/img/subplots.png"))
         self.actionBuildSubPlots.triggered.connect(self.slot_BuildSubPlots)
 
+        self.actionBuildSeries = QtWidgets.QAction("Build series plot")
+        self.actionBuildSeries.triggered.connect(self.slot_BuildSeries)
+
         self.menuPlot.addAction(self.actionBuildSubPlots)
+        self.menuPlot.addAction(self.actionBuildSeries)
         self.menuPlot.addSeparator()
         self.menuPlot.addAction(self.actionSavePlot)
         self.menuPlot.addAction(self.actionSavePlots)
 
+        self.menuAnalysis = QtWidgets.QMenu("&Analysis")
+
+        self.actionFindPeaks = QtWidgets.QAction("Find peaks")
+        self.actionFindPeaks.triggered.connect(self.slot_FindPeaks)
+
+        self.actionSearchMatch = QtWidgets.QAction("Search–match")
+        self.actionSearchMatch.triggered.connect(self.slot_SearchMatch)
+
+        self.actionFit = QtWidgets.QAction("Fit profiles")
+        self.actionFit.triggered.connect(self.slot_Fit)
+
+        self.actionSmooth = QtWidgets.QAction("Smooth")
+        self.actionSmooth.triggered.connect(self.slot_Smooth)
+
+        self.actionBackground = QtWidgets.QAction("Subtract background")
+        self.actionBackground.triggered.connect(self.slot_Background)
+
+        self.actionStripKa2 = QtWidgets.QAction("Strip Kα2")
+        self.actionStripKa2.triggered.connect(self.slot_StripKa2)
+
+        self.actionArithmetic = QtWidgets.QAction("Pattern arithmetic")
+        self.actionArithmetic.triggered.connect(self.slot_Arithmetic)
+
+        self.actionCalibration = QtWidgets.QAction("Apply calibration")
+        self.actionCalibration.triggered.connect(self.slot_Calibration)
+
+        self.menuAnalysis.addAction(self.actionFindPeaks)
+        self.menuAnalysis.addAction(self.actionSearchMatch)
+        self.menuAnalysis.addAction(self.actionFit)
+        self.menuAnalysis.addSeparator()
+        self.menuAnalysis.addAction(self.actionSmooth)
+        self.menuAnalysis.addAction(self.actionBackground)
+        self.menuAnalysis.addAction(self.actionStripKa2)
+        self.menuAnalysis.addSeparator()
+        self.menuAnalysis.addAction(self.actionArithmetic)
+        self.menuAnalysis.addAction(self.actionCalibration)
+
         self.menuWindow = QtWidgets.QMenu("&Window")
 
         self.actionFullScreen = QtWidgets.QAction("Full screen")
@@ -94,7 +183,12 @@ class MainWindow(QtWidgets.QMainWindow):
         self.actionFullScreen.setShortcut(QtGui.QKeySequence(QtCore.Qt.Key_F11))
         self.actionFullScreen.triggered.connect(self.slot_FullScreen)
 
+        self.dockPerformance = PerformanceDock(self)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.dockPerformance)
+        self.dockPerformance.hide()
+
         self.menuWindow.addAction(self.actionFullScreen)
+        self.menuWindow.addAction(self.dockPerformance.toggleViewAction())
 
         self.menuHelp = QtWidgets.QMenu("&Help")
 
@@ -117,14 +211,198 @@ class MainWindow(QtWidgets.QMainWindow):
         self.menuBar.addMenu(self.menuFile)
         self.menuBar.addMenu(self.menuTable)
         self.menuBar.addMenu(self.menuPlot)
+        self.menuBar.addMenu(self.menuAnalysis)
         self.menuBar.addMenu(self.menuWindow)
         self.menuBar.addMenu(self.menuHelp)
 
+        self.threadPool = QtCore.QThreadPool(self)
+        self.threadPool.setMaxThreadCount(max(1, QtCore.QThread.idealThreadCount()))
+        self.workers = []
+        self.streams = {}
+        self.followers = {}
+        self.stageCache = fishcore.StageCache()
+        self.gridCache = fishcore.StageCache(4)
+        self.datasets = fishcore.DatasetStore()
+        self.windows = {}
+        self.views = {}
+        self.viewDatasets = {}
+        self.cache = None
+        self.renderPool = None
+        self.sessionFiles = {}
+        self.calibrations = None
+        self.calibrationsTime = None
+        self.references = None
+        self.referencesTime = None
+        self.importTotal = 0
+        self.importDone = 0
+
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setMaximumWidth(250)
+        self.progressBar.hide()
+        self.statusBar().addPermanentWidget(self.progressBar)
+
     def closeEvent(self, event):
         event.ignore()
         if QtWidgets.QMessageBox.Yes == QtWidgets.QMessageBox.question(self, "Exit", "Exit?", QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No):
+            if self.renderPool is not None:
+                self.renderPool.shutdown(wait=False, cancel_futures=True)
+            sett = QtCore.QSettings(PROGRAM_PATH + "/settings.ini", QtCore.QSettings.IniFormat)
+            if sett.value("Session/autosave", "true") == "true" and self.windows:
+                try:
+                    self.saveSession(self.autosaveFile())
+                except Exception:
+                    QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
             event.accept()
 
+    @QtCore.Slot()
+    def slot_openSession(self):
+        sett = QtCore.QSettings(PROGRAM_PATH + "/settings.ini", QtCore.QSettings.IniFormat)
+        file_name = QtWidgets.QFileDialog.getOpenFileName(self, "Open session", sett.value("Session/path"), "FishX session (*.fxs);;All files(*.*)")[0]
+        if file_name:
+            sett.setValue("Session/path", file_name)
+            self.openSession(file_name)
+
+    @QtCore.Slot()
+    def slot_saveSession(self):
+        sett = QtCore.QSettings(PROGRAM_PATH + "/settings.ini", QtCore.QSettings.IniFormat)
+        file_name = QtWidgets.QFileDialog.getSaveFileName(self, "Save session", sett.value("Session/path"), "FishX session (*.fxs)")[0]
+        if not file_name:
+            return
+        if not file_name.endswith(".fxs"):
+            file_name += ".fxs"
+        sett.setValue("Session/path", file_name)
+        if platform.system() == "Windows" and not self.releaseSession(file_name):
+            QtWidgets.QMessageBox.critical(self, "Error", file_name + " is still in use by the open session and cannot be replaced. Save the session under another name.")
+            return
+        try:
+            self.saveSession(file_name)
+        except Exception:
+            QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+        else:
+            QtWidgets.QMessageBox.information(self, "Save", "Done")
+
+    @QtCore.Slot()
+    def slot_restoreSession(self):
+        files = [PROGRAM_PATH + "/" + it for it in AUTOSAVE_FILES if os.path.isfile(PROGRAM_PATH + "/" + it)]
+        if not files:
+            QtWidgets.QMessageBox.information(self, "Restore last session", "There is no saved session")
+            return
+        self.openSession(max(files, key=os.path.getmtime))
+
+    def autosaveFile(self):
+        # A mapped file cannot be replaced on Windows: never write over a session opened in this run
+        files = sorted((PROGRAM_PATH + "/" + it for it in AUTOSAVE_FILES), key=lambda it: os.path.getmtime(it) if os.path.isfile(it) else 0)
+        for file_name in files:
+            if self.sessionMapping(file_name) is None:
+                return file_name
+        return files[0]
+
+    def sessionMapping(self, file_name):
+        ref = self.sessionFiles.get(os.path.normcase(os.path.realpath(file_name)))
+        return ref() if ref is not None else None
+
+    def releaseSession(self, file_name):
+        # Windows cannot replace a mapped file; False if the map is still referenced
+        mapping = self.sessionMapping(file_name)
+        if mapping is None:
+            return True
+        for dataset in list(self.datasets):
+            if any(fishcore.sessionMapping(it) is mapping for it in dataset.columns):
+                dataset.replace([numpy.array(it) for it in dataset.columns], dataset.count)
+                self.refreshViews(dataset)
+        for window in self.windows.values():
+            if window.widget().metaObject().className() == "PlotWidget":
+                window.widget().release_Mapping(mapping)
+        del mapping
+        gc.collect()
+        return self.sessionMapping(file_name) is None
+
+    def saveSession(self, file_name):
+        arrays = []
+        datasets = []
+        windows = []
+        for window in self.mdiArea.subWindowList(QtWidgets.QMdiArea.StackingOrder):
+            title = window.windowTitle()
+            if self.windows.get(title) is not window:
+                continue
+            w = window.widget()
+            state = w.get_State(arrays) if w.metaObject().className() == "PlotWidget" else w.get_State()
+            geometry = window.geometry() if not (window.isMinimized() or window.isMaximized()) else window.normalGeometry()
+            state.update(title=title, geometry=[geometry.x(), geometry.y(), geometry.width(), geometry.height()],
+                         minimized=window.isMinimized(), maximized=window.isMaximized())
+            windows.append(state)
+        for dataset in self.datasets:
+            columns = dataset.data()
+            datasets.append({'id': dataset.id, 'name': dataset.name, 'names': dataset.names, 'meta': dataset.meta,
+                             'columns': list(range(len(arrays), len(arrays) + len(columns)))})
+            arrays.extend(columns)
+        with fishcore.PROFILER.stage("session save", sum(len(it) for it in arrays), file=os.path.basename(file_name)):
+            fishcore.writeSession(file_name, {'datasets': datasets, 'windows': windows}, arrays)
+
+    def openSession(self, file_name):
+        with fishcore.PROFILER.stage("session open", file=os.path.basename(file_name)) as stage:
+            try:
+                header, arrays = fishcore.readSession(file_name)
+            except Exception:
+                QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+                return
+            mapping = fishcore.sessionMapping(arrays[0]) if arrays else None
+            if mapping is not None:
+                self.sessionFiles[os.path.normcase(os.path.realpath(file_name))] = weakref.ref(mapping)
+            stage.rows = sum(len(it) for it in arrays)
+            self.restoreSession(header, arrays)
+
+    def restoreSession(self, header, arrays):
+        datasets = {}
+        states = []
+        for it in header["datasets"]:
+            datasets[it["id"]] = self.datasets.add(it["name"], [arrays[i] for i in it["columns"]], it["names"], it["meta"])
+        for it in header["windows"]:
+            if it["type"] == "table":
+                widget = TableWidget(self, it["name"], True)
+                self.restoreTitle(widget, it["title"])
+                widget.set_Dataset(datasets[it["dataset"]], tuple(it["headers"]))
+            elif it["type"] == "series":
+                widget = SeriesWidget(self, it["name"], True)
+                self.restoreTitle(widget, it["title"])
+                widget.set_Options(it["mode"], it["axis"], it["offset"], it["log"])
+                widget.set_Datasets([datasets[id] for id in it["datasets"]], it["keys"])
+            else:
+                widget = PlotWidget(self, it["name"], True)
+                self.restoreTitle(widget, it["title"])
+                series = []
+                for s in it["series"]:
+                    if "dataset" in s:
+                        series.append((s["key"], datasets[s["dataset"]], None, {}))
+                    else:
+                        series.append((s["key"], None, [arrays[i] for i in s["columns"]], s["style"]))
+                widget.restore_Series(series)
+            window = self.loadSubWindow(widget)
+            window.setGeometry(*it["geometry"])
+            states.append((window, it))
+        for window, it in states:
+            if it["minimized"]:
+                window.showMinimized()
+        for window, it in states:
+            if it["maximized"]:
+                window.showMaximized()
+        for id, dataset in datasets.items():
+            if dataset.id not in self.views:
+                self.datasets.remove(dataset.id)
+
+    def restoreTitle(self, widget, title):
+        global ResTableWidgetID, ResPlotWidgetID
+        if title in self.windows:
+            return
+        widget.setWindowTitle(title)
+        match = re.match(r"(Table|Plot) (\d+):", title)
+        if match is None:
+            return
+        if match.group(1) == "Table":
+            ResTableWidgetID = max(ResTableWidgetID, int(match.group(2)))
+        else:
+            ResPlotWidgetID = max(ResPlotWidgetID, int(match.group(2)))
+
     @QtCore.Slot()
     def slot_FullScreen(self):
         if self.isFullScreen():
@@ -150,10 +428,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     @QtCore.Slot()
     def slot_SaveTable(self):
-        lst = []
-        for it_lst in self.mdiArea.subWindowList():
-            if it_lst.widget().metaObject().className() == "TableWidget":
-                lst.append(it_lst)
+        lst = self.tableWindows()
         dialogSave = DialogSave(self, 'table', lst)
         vivisection = dialogSave.exec()
         if vivisection == QtWidgets.QDialog.Accepted:
@@ -165,10 +440,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     @QtCore.Slot()
     def slot_SaveTables(self):
-        lst = []
-        for it_lst in self.mdiArea.subWindowList():
-            if it_lst.widget().metaObject().className() == "TableWidget":
-                lst.append(it_lst)
+        lst = self.tableWindows()
         dialogSave = DialogSave(self, 'tables', lst)
         vivisection = dialogSave.exec()
         if vivisection == QtWidgets.QDialog.Accepted:
@@ -191,10 +463,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     @QtCore.Slot()
     def slot_SavePlot(self):
-        lst = []
-        for it_lst in self.mdiArea.subWindowList():
-            if it_lst.widget().metaObject().className() == "PlotWidget":
-                lst.append(it_lst)
+        lst = self.plotWindows()
         dialogSave = DialogSave(self, 'plot', lst)
         vivisection = dialogSave.exec()
         if vivisection == QtWidgets.QDialog.Accepted:
@@ -206,10 +475,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     @QtCore.Slot()
     def slot_SavePlots(self):
-        lst = []
-        for it_lst in self.mdiArea.subWindowList():
-            if it_lst.widget().metaObject().className() == "PlotWidget":
-                lst.append(it_lst)
+        lst = self.plotWindows()
         dialogSave = DialogSave(self, 'plots', lst)
         vivisection = dialogSave.exec()
         if vivisection == QtWidgets.QDialog.Accepted:
@@ -220,44 +486,104 @@ class MainWindow(QtWidgets.QMainWindow):
             QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
 
     def SaveFunc(self, lst):
-        windowList = self.mdiArea.subWindowList()
-        currentWindow = None
-        for it_wl in windowList:
-            if it_wl.windowTitle() == lst[0]:
-                currentWindow = it_wl
-                break
         try:
-            w = currentWindow.widget()
+            w = self.findWindow(lst[0]).widget()
             if w.metaObject().className() == "TableWidget":
-                w.Save(lst[1],lst[2])
+                self.exportTables([[w, lst[1]]], lst[2])
             else:
-                w.Save(lst[1])
+                self.renderPlots([[w, lst[1]]], lst[3])
         except Exception:
             QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
-        else:
-            QtWidgets.QMessageBox.information(self, "Save", "Done")
 
     def SaveSerialFunc(self, lst):
-        windowList = self.mdiArea.subWindowList()
-        currentWindow = None
+        tables = []
+        plots = []
         for it_lst in lst[1]:
-            for it_wl in windowList:
-                if it_wl.windowTitle() == it_lst:
-                    currentWindow = it_wl
-                    break
-            try:
-                currentWindow.widget().Save(lst[0] + it_lst + lst[2],lst[3])
-            except Exception:
-                QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
-                return
-        QtWidgets.QMessageBox.information(self, "Save", "Done")
+            w = self.findWindow(it_lst).widget()
+            if w.metaObject().className() == "TableWidget":
+                tables.append([w, lst[0] + it_lst + lst[2]])
+            else:
+                plots.append([w, lst[0] + it_lst + lst[2]])
+        try:
+            if tables:
+                self.exportTables(tables, lst[3])
+            if plots:
+                self.renderPlots(plots, lst[4])
+        except Exception:
+            QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+
+    def startBatch(self, text, total, title="Save"):
+        progress = QtWidgets.QProgressDialog(text, "Cancel", 0, total, self)
+        progress.setWindowTitle(title)
+        progress.setWindowModality(QtCore.Qt.WindowModal)
+        progress.setMinimumDuration(500)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        batch = {'cancelled': threading.Event(), 'futures': [], 'progress': progress, 'done': 0, 'total': total, 'errors': []}
+        batch['cancel'] = lambda: self.cancelBatch(batch)
+        progress.canceled.connect(batch['cancel'])
+        return batch
+
+    def cancelBatch(self, batch):
+        batch['cancelled'].set()
+        for future in batch['futures']:
+            future.cancel()
+
+    def exportTables(self, tables, delimiter):
+        # Streamed and followed datasets are still written in place, their columns are copied
+        batch = self.startBatch("Saving tables...", len(tables))
+        live = set(self.streams.values()) | set(self.followers.values())
+        for w, file_name in tables:
+            columns = w.dataset.data()
+            if w.dataset in live:
+                columns = [numpy.array(it, copy=True) for it in columns]
+            worker = FishExport(file_name, columns, w.dataset.names, delimiter, batch)
+            worker.quit.connect(self.slot_exported)
+            self.workers.append(worker)
+            self.threadPool.start(FishTask(worker))
+
+    def renderPlots(self, plots, rasterize):
+        batch = self.startBatch("Saving plots...", len(plots))
+        pool = self.get_RenderPool()
+        for w, file_name in plots:
+            worker = FishRender(batch)
+            worker.quit.connect(self.slot_exported)
+            self.workers.append(worker)
+            w.build()
+            spec = w.sc.get_Spec()
+            rows = sum(len(it[1]) for it in spec['series']) if 'series' in spec else getattr(spec['matrix'], 'size', 0)
+            worker.start(pool.submit(fishcore.renderFigure, file_name, spec, 300, rasterize), file_name, rows)
+
+    def get_RenderPool(self):
+        if self.renderPool is None:
+            # Forking a process that runs Qt is not safe; spawned workers import fishx again but never start Qt
+            self.renderPool = concurrent.futures.ProcessPoolExecutor(max(1, os.cpu_count() or 1), multiprocessing.get_context("spawn"))
+        return self.renderPool
+
+    @QtCore.Slot(str)
+    def slot_exported(self, err):
+        batch = self.sender().batch
+        self.workers.remove(self.sender())
+        batch['done'] += 1
+        if err:
+            batch['errors'].append(err)
+        progress = batch['progress']
+        progress.setValue(batch['done'])
+        if batch['done'] < batch['total']:
+            return
+        # Closing the dialog emits canceled, read the state first
+        cancelled = batch['cancelled'].is_set()
+        progress.close()
+        if batch['errors']:
+            QtWidgets.QMessageBox.critical(self, "Error", batch['errors'][0])
+        elif cancelled:
+            QtWidgets.QMessageBox.information(self, "Save", "Cancelled")
+        else:
+            QtWidgets.QMessageBox.information(self, "Save", "Done")
 
     @QtCore.Slot()
     def slot_BuildSubPlots(self):
-        lst = []
-        for it_lst in self.mdiArea.subWindowList():
-            if it_lst.widget().metaObject().className() == "TableWidget":
-                lst.append(it_lst)
+        lst = self.tableWindows()
         dialog = BuildPlotDialog(self,lst)
         vivisection = dialog.exec()
         if vivisection == QtWidgets.QDialog.Accepted:
@@ -267,37 +593,476 @@ class MainWindow(QtWidgets.QMainWindow):
         else:
             QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
 
+    @QtCore.Slot()
+    def slot_BuildSeries(self):
+        dialog = DialogSeries(self, self.tableWindows())
+        vivisection = dialog.exec()
+        if vivisection == QtWidgets.QDialog.Accepted:
+            self.addSeries(dialog.getInput())
+        elif vivisection == QtWidgets.QDialog.Rejected:
+            pass
+        else:
+            QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
+
+    def addSeries(self, lst):
+        titles, mode, axis, offset, log = lst
+        if not titles:
+            return
+        seriesWidget = SeriesWidget(self, "Series of " + str(len(titles)))
+        seriesWidget.set_Options(mode, axis, offset, log)
+        try:
+            seriesWidget.set_Datasets([self.findWindow(it).widget().dataset for it in titles], titles)
+        except Exception:
+            QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+            seriesWidget.detach_Datasets()
+            seriesWidget.deleteLater()
+            return
+        self.loadSubWindow(seriesWidget)
+
+    @QtCore.Slot()
+    def slot_FindPeaks(self):
+        dialog = DialogPeaks(self, self.tableWindows())
+        vivisection = dialog.exec()
+        if vivisection == QtWidgets.QDialog.Accepted:
+            self.findPeaks(dialog.getInput())
+        elif vivisection == QtWidgets.QDialog.Rejected:
+            pass
+        else:
+            QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
+
+    def findPeaks(self, lst):
+        widgets = [self.findWindow(it).widget() for it in lst[0]]
+        patterns = [it.dataset.data()[:2] for it in widgets]
+        try:
+            with fishcore.PROFILER.stage("find peaks", sum(len(it[0]) for it in patterns)):
+                peaks = fishcore.findPeaks(patterns, lst[1], lst[2], lst[3])
+        except Exception:
+            QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+            return
+        for w, table in zip(widgets, peaks):
+            dataset = self.datasets.add("Peaks: " + w.name, table.T, fishcore.PEAK_COLUMNS, {'source': w.dataset.id, 'wavelength': lst[1]})
+            tableWidget = TableWidget(self, dataset.name)
+            tableWidget.set_Dataset(dataset, ("2θ", "Height", "FWHM", "Centroid", "d, Å"))
+            self.loadSubWindow(tableWidget)
+            if lst[4]:
+                plotWidget = PlotWidget(self, w.name)
+                plotWidget.set_Datasets([w.dataset], [w.name])
+                plotWidget.set_Markers("Peaks", table[:, 0], table[:, 1])
+                self.loadSubWindow(plotWidget)
+
+    @QtCore.Slot()
+    def slot_SearchMatch(self):
+        dialog = DialogSearchMatch(self, self.tableWindows())
+        vivisection = dialog.exec()
+        if vivisection == QtWidgets.QDialog.Accepted:
+            self.searchMatch(dialog.getInput())
+        elif vivisection == QtWidgets.QDialog.Rejected:
+            pass
+        else:
+            QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
+
+    def get_References(self):
+        try:
+            mtime = os.path.getmtime(fishcore.REFERENCE_DIRECTORY)
+        except OSError:
+            mtime = None
+        if self.references is None or mtime != self.referencesTime:
+            # The old index may still be mapped while it is rebuilt
+            self.references = None
+            self.references = fishcore.loadReferences()
+            self.referencesTime = mtime
+        return self.references
+
+    def searchMatch(self, lst):
+        titles, wavelength, tolerance, min_height, candidates = lst
+        widgets = [self.findWindow(it).widget() for it in titles]
+        patterns = [it for it in widgets if tuple(it.dataset.names) != fishcore.PEAK_COLUMNS]
+        try:
+            library = self.get_References()
+            if not len(library):
+                QtWidgets.QMessageBox.warning(self, "Search–match", "The reference library is empty.\nPut card files into " + fishcore.REFERENCE_DIRECTORY)
+                return
+            data = [it.dataset.data()[:2] for it in patterns]
+            with fishcore.PROFILER.stage("find peaks", sum(len(it[0]) for it in data)):
+                found = dict(zip((it.dataset.id for it in patterns), fishcore.findPeaks(data, wavelength, min_height)))
+            results = []
+            for w in widgets:
+                if w.dataset.id in found:
+                    table = found[w.dataset.id]
+                    peaks = (table[:, 0], table[:, 1])
+                    pattern = w.dataset
+                else:
+                    peaks = tuple(w.dataset.data()[:2])
+                    source = w.dataset.meta.get('source')
+                    pattern = self.datasets.get(source) if source in self.datasets else None
+                with fishcore.PROFILER.stage("search-match", len(library.d), peaks=len(peaks[0])):
+                    results.append((w, pattern, peaks, library.search(peaks[0], peaks[1], wavelength, tolerance, candidates)))
+        except Exception:
+            QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+            return
+        for w, pattern, peaks, candidates in results:
+            dialog = SearchMatchDialog(self, w.name, pattern, peaks, wavelength, library, candidates)
+            dialog.show()
+
+    @QtCore.Slot()
+    def slot_Fit(self):
+        dialog = DialogFit(self, self.tableWindows())
+        vivisection = dialog.exec()
+        if vivisection == QtWidgets.QDialog.Accepted:
+            self.fitTables(dialog.getInput())
+        elif vivisection == QtWidgets.QDialog.Rejected:
+            pass
+        else:
+            QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
+
+    def fitTables(self, lst):
+        titles, profile, regions, count, order, min_height, plot = lst
+        datasets = [self.findWindow(it).widget().dataset for it in titles]
+        size = max(1, -(-len(datasets) // (os.cpu_count() or 1)))
+        tasks = []
+        rows = []
+        for region, (lo, hi) in enumerate(regions, 1):
+            for start in range(0, len(datasets), size):
+                patterns = []
+                for number, dataset in enumerate(datasets[start:start + size], start + 1):
+                    x, y = dataset.data()[:2]
+                    mask = (x >= lo) & (x <= hi)
+                    patterns.append((x[mask], y[mask]))
+                    rows.append((number, region))
+                tasks.append((patterns, lo, hi, profile, count, order, min_height))
+        if not tasks:
+            return
+        try:
+            pool = self.get_RenderPool()
+        except Exception:
+            QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+            return
+        batch = self.startBatch("Fitting profiles...", len(rows), "Fit profiles")
+        batch.update(results=[None] * len(rows), rows=rows, titles=titles, datasets=datasets, profile=profile, regions=regions,
+                     plot=plot, rows_total=sum(len(x) for task in tasks for x, y in task[0]), clock=time.perf_counter())
+        start = 0
+        for task in tasks:
+            worker = FishFit(batch, start, len(task[0]))
+            worker.quit.connect(self.slot_fitted)
+            self.workers.append(worker)
+            worker.start(pool.submit(fishcore.fitPatterns, *task))
+            start += len(task[0])
+
+    @QtCore.Slot(str)
+    def slot_fitted(self, err):
+        worker = self.sender()
+        batch = worker.batch
+        self.workers.remove(worker)
+        batch['done'] += worker.count
+        if err:
+            batch['errors'].append(err)
+        progress = batch['progress']
+        progress.setValue(batch['done'])
+        if batch['done'] < batch['total']:
+            return
+        # Closing the dialog emits canceled, read the state first
+        cancelled = batch['cancelled'].is_set()
+        progress.close()
+        if batch['errors']:
+            QtWidgets.QMessageBox.critical(self, "Error", batch['errors'][0])
+        elif cancelled:
+            QtWidgets.QMessageBox.information(self, "Fit profiles", "Cancelled")
+        else:
+            if fishcore.PROFILER.enabled:
+                fishcore.PROFILER.record("fit", time.perf_counter() - batch['clock'], batch['rows_total'], None,
+                                         {'profile': batch['profile'], 'fits': batch['total']})
+            self.showFits(batch)
+
+    def showFits(self, batch):
+        order = sorted(range(len(batch['rows'])), key=batch['rows'].__getitem__)
+        results = [batch['results'][it] for it in order]
+        rows = [batch['rows'][it] for it in order]
+        datasets, profile = batch['datasets'], batch['profile']
+        names = ", ".join(it.name for it in datasets[:3]) + (", …" if len(datasets) > 3 else "")
+        meta = {'sources': [it.id for it in datasets], 'profile': profile, 'regions': batch['regions']}
+        shape = "η" if profile == "pseudo-Voigt" else "m"
+
+        table = fishcore.fitTable(results, rows)
+        dataset = self.datasets.add("Fit (" + profile + "): " + names, table.T, fishcore.FIT_COLUMNS, meta)
+        tableWidget = TableWidget(self, dataset.name)
+        tableWidget.set_Dataset(dataset, ("Pattern", "Region", "Peak", "2θ", "Height", "FWHM", shape, "Area",
+                                          "σ 2θ", "σ Height", "σ FWHM", "σ " + shape, "Rwp", "Converged"))
+        self.loadSubWindow(tableWidget)
+
+        fitted = [(number, result) for (number, region), result in zip(rows, results) if not isinstance(result, str)]
+        if fitted:
+            columns = [numpy.concatenate([numpy.full(len(result['x']), float(number)) for number, result in fitted])]
+            columns += [numpy.concatenate([result[key] for number, result in fitted]) for key in ('x', 'y', 'fit')]
+            columns.append(columns[2] - columns[3])
+            dataset = self.datasets.add("Fit residuals: " + names, columns, ("pattern", "two_theta", "observed", "fit", "residual"), meta)
+            tableWidget = TableWidget(self, dataset.name)
+            tableWidget.set_Dataset(dataset, ("Pattern", "2θ", "Observed", "Fit", "Residual"))
+            self.loadSubWindow(tableWidget)
+
+        if batch['plot']:
+            for number, (title, source) in enumerate(zip(batch['titles'], datasets), 1):
+                curves = [result for n, result in fitted if n == number]
+                if not curves:
+                    continue
+                plotWidget = PlotWidget(self, "Fit: " + source.name)
+                if source.id in self.datasets:
+                    plotWidget.set_Datasets([source], [title])
+                gap = numpy.array([numpy.nan])
+                x = numpy.concatenate([numpy.concatenate((it['x'], gap)) for it in curves])
+                fit = numpy.concatenate([numpy.concatenate((it['fit'], gap)) for it in curves])
+                residual = numpy.concatenate([numpy.concatenate((it['y'] - it['fit'], gap)) for it in curves])
+                offset = min(it['y'].min() for it in curves) - numpy.nanmax(residual)
+                plotWidget.set_Curve("Fit", x, fit, "red")
+                plotWidget.set_Curve("Residual", x, residual + offset, "gray")
+                self.loadSubWindow(plotWidget)
+
+        failed = [batch['titles'][number - 1] + ", region " + str(region) + ": " + result
+                  for (number, region), result in zip(rows, results) if isinstance(result, str)]
+        if failed:
+            QtWidgets.QMessageBox.warning(self, "Fit profiles", "These regions were not fitted:\n" + "\n".join(failed))
+
+    @QtCore.Slot()
+    def slot_Smooth(self):
+        dialog = DialogSmooth(self, self.tableWindows())
+        vivisection = dialog.exec()
+        if vivisection == QtWidgets.QDialog.Accepted:
+            self.processTables(dialog.getInput())
+        elif vivisection == QtWidgets.QDialog.Rejected:
+            pass
+        else:
+            QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
+
+    @QtCore.Slot()
+    def slot_Background(self):
+        dialog = DialogBackground(self, self.tableWindows())
+        vivisection = dialog.exec()
+        if vivisection == QtWidgets.QDialog.Accepted:
+            self.processTables(dialog.getInput())
+        elif vivisection == QtWidgets.QDialog.Rejected:
+            pass
+        else:
+            QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
+
+    @QtCore.Slot()
+    def slot_StripKa2(self):
+        dialog = DialogKa2(self, self.tableWindows())
+        vivisection = dialog.exec()
+        if vivisection == QtWidgets.QDialog.Accepted:
+            self.processTables(dialog.getInput())
+        elif vivisection == QtWidgets.QDialog.Rejected:
+            pass
+        else:
+            QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
+
+    @QtCore.Slot()
+    def slot_Arithmetic(self):
+        dialog = DialogArithmetic(self, self.tableWindows())
+        vivisection = dialog.exec()
+        if vivisection == QtWidgets.QDialog.Accepted:
+            self.combineTables(dialog.getInput())
+        elif vivisection == QtWidgets.QDialog.Rejected:
+            pass
+        else:
+            QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
+
+    def combineTables(self, lst):
+        titles, operation, step, factor, plot = lst
+        if not titles:
+            return
+        datasets = [self.findWindow(it).widget().dataset for it in titles]
+        try:
+            grid, matrix = self.resampleDatasets(datasets, step)
+            with fishcore.PROFILER.stage(operation, matrix.size, patterns=len(datasets)):
+                result = fishcore.combinePatterns(matrix, operation, factor)
+        except Exception:
+            QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+            return
+        names = ", ".join(it.name for it in datasets[:3]) + (", …" if len(datasets) > 3 else "")
+        dataset = self.datasets.add(operation.capitalize() + ": " + names, (grid, result),
+                                    meta={'sources': [it.id for it in datasets], 'operation': operation, 'step': step, 'factor': factor})
+        tableWidget = TableWidget(self, dataset.name)
+        tableWidget.set_Dataset(dataset)
+        self.loadSubWindow(tableWidget)
+        if plot:
+            plotWidget = PlotWidget(self, dataset.name)
+            plotWidget.set_Datasets(datasets + [dataset], titles + [tableWidget.windowTitle()])
+            self.loadSubWindow(plotWidget)
+
+    def resampleDatasets(self, datasets, step=0):
+        def resample():
+            patterns = [it.data()[:2] for it in datasets]
+            with fishcore.PROFILER.stage("resample", sum(len(it[0]) for it in patterns), patterns=len(patterns)):
+                grid = fishcore.commonGrid(patterns, step)
+                return grid, fishcore.resamplePatterns(patterns, grid)
+
+        return self.gridCache.get((tuple((it.id, it.revision) for it in datasets), step), resample)
+
+    @QtCore.Slot()
+    def slot_Calibration(self):
+        dialog = DialogCalibration(self, self.tableWindows())
+        vivisection = dialog.exec()
+        if vivisection == QtWidgets.QDialog.Accepted:
+            self.applyCalibration(dialog.getInput())
+        elif vivisection == QtWidgets.QDialog.Rejected:
+            pass
+        else:
+            QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
+
+    def get_Calibrations(self):
+        try:
+            mtime = os.path.getmtime(fishcore.CALIBRATION_FILE)
+        except OSError:
+            mtime = None
+        if self.calibrations is None or mtime != self.calibrationsTime:
+            try:
+                self.calibrations = fishcore.loadCalibrations()
+            except Exception:
+                QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+                self.calibrations = fishcore.loadCalibrations(os.devnull)
+            self.calibrationsTime = mtime
+        return self.calibrations
+
+    def applyCalibration(self, lst):
+        titles, name = lst
+        calibration = self.get_Calibrations()[name]
+        streams = {dataset.id: stream for stream, dataset in self.streams.items()}
+        followers = {dataset.id: follower for follower, dataset in self.followers.items()}
+        skipped = []
+        with fishcore.PROFILER.stage("calibrate", profile=name) as stage:
+            rows = 0
+            for title in titles:
+                dataset = self.findWindow(title).widget().dataset
+                meta = dataset.meta
+                if "start" not in meta or not ("end" in meta or "step" in meta):
+                    skipped.append(title)
+                    continue
+                try:
+                    if dataset.id in followers:
+                        live = followers[dataset.id].live
+                        live.calibrate(calibration)
+                        dataset.replace((live.two_theta, live.intensity), live.count)
+                    elif dataset.id in streams:
+                        stream = streams[dataset.id]
+                        stream.calibrate(calibration)
+                        dataset.replace((stream.two_theta, stream.intensity), dataset.count)
+                    else:
+                        two_theta = fishcore.calibratedGrid(meta, len(dataset.columns[0]), calibration)
+                        dataset.replace([two_theta] + dataset.columns[1:], dataset.count)
+                except Exception:
+                    QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+                    return
+                meta['calibration'] = name
+                rows += dataset.count
+                self.refreshViews(dataset)
+            stage.rows = rows
+        if skipped:
+            QtWidgets.QMessageBox.warning(self, "Apply calibration", "These tables were not converted from multimeter logs and were left unchanged:\n" + "\n".join(skipped))
+
+    def processTables(self, lst):
+        titles, stage, params, label, plot = lst
+        for title in titles:
+            source = self.findWindow(title).widget().dataset
+            data = source.data()
+
+            def compute():
+                with fishcore.PROFILER.stage("stage " + stage, len(data[0]), dataset=source.name):
+                    return fishcore.runStage(stage, data[0], data[1], params)
+
+            try:
+                result, background = self.stageCache.get((source.id, source.revision, stage, params), compute)
+            except Exception:
+                QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+                return
+            dataset = self.datasets.add(label + ": " + source.name, (data[0], result), meta={'source': source.id, 'stage': stage, 'params': params})
+            tableWidget = TableWidget(self, dataset.name)
+            tableWidget.set_Dataset(dataset)
+            self.loadSubWindow(tableWidget)
+            if plot:
+                plotWidget = PlotWidget(self, dataset.name)
+                plotWidget.set_Datasets([source, dataset], [title, tableWidget.windowTitle()])
+                if background is not None:
+                    plotWidget.add_Pattern("Background", [data[0], background])
+                self.loadSubWindow(plotWidget)
+
+    def tableWindows(self):
+        return [it for it in self.windows.values() if it.widget().metaObject().className() == "TableWidget"]
+
+    def plotWindows(self):
+        return [it for it in self.windows.values() if it.widget().metaObject().className() in ("PlotWidget", "SeriesWidget")]
+
+    def findWindow(self, title):
+        return self.windows.get(title)
+
     def loadSubWindow(self, widget):
         window = self.mdiArea.addSubWindow(widget)
         window.setWindowTitle(widget.windowTitle())
         window.setWindowIcon(widget.windowIcon())
         window.resize(widget.geometry().width(), widget.geometry().height())
+        title = window.windowTitle()
+        self.windows[title] = window
+        window.destroyed.connect(lambda obj=None, title=title: self.unregisterWindow(title))
         window.show()
+        return window
+
+    def attachView(self, title, id):
+        self.views.setdefault(id, set()).add(title)
+        self.viewDatasets.setdefault(title, set()).add(id)
+
+    def detachView(self, title, id):
+        self.viewDatasets.get(title, set()).discard(id)
+        titles = self.views.get(id)
+        if titles is None:
+            return
+        titles.discard(title)
+        if not titles:
+            del self.views[id]
+            self.datasets.remove(id)
+
+    def unregisterWindow(self, title):
+        self.windows.pop(title, None)
+        for id in list(self.viewDatasets.get(title, ())):
+            self.detachView(title, id)
+        self.viewDatasets.pop(title, None)
+
+    def refreshViews(self, dataset):
+        for title in self.views.get(dataset.id, ()):
+            self.windows[title].widget().refresh_Dataset(dataset)
 
     def addPlot(self, pattern=None, lst=None):
         if pattern == 's':
-            data = []
-            windowList = self.mdiArea.subWindowList()
-            currentWindow = None
-            for it_lst in lst:
-                for it_wl in windowList:
-                    if it_wl.windowTitle() == it_lst:
-                        currentWindow = it_wl
-                        break
-                data.append(currentWindow.widget().get_AllData())
             plotWidget = PlotWidget(self)
-            plotWidget.set_serialData(data)
+            plotWidget.set_Datasets([self.findWindow(it).widget().dataset for it in lst], lst)
         else:
             w = self.mdiArea.activeSubWindow().widget()
             if w.metaObject().className() == "TableWidget":
-                wl = w.get_Data()
-                plotWidget = PlotWidget(self, wl[1])
-                plotWidget.set_Data(wl[0])
+                self.plotSelection(w)
+            return
         self.loadSubWindow(plotWidget)
 
-    @QtCore.Slot()
-    def loadPlot(self):
-        self.addPlot()
+    def plotSelection(self, tableWidget):
+        wl = tableWidget.get_Data()
+        plotWidget = PlotWidget(self, wl[1])
+        plotWidget.set_Data(wl[0])
+        self.loadSubWindow(plotWidget)
+        tableWidget.selectionPlots.append(plotWidget.windowTitle())
+
+    def editPlot(self, plotWidget):
+        lst = self.tableWindows()
+        patterns = plotWidget.get_Patterns()
+        dialog = BuildPlotDialog(self, lst, patterns)
+        vivisection = dialog.exec()
+        if vivisection == QtWidgets.QDialog.Accepted:
+            items = dialog.getInput()
+            for it_lst in lst:
+                title = it_lst.windowTitle()
+                if title in patterns and title not in items:
+                    plotWidget.remove_Pattern(title)
+                elif title in items and title not in patterns:
+                    plotWidget.add_Dataset(title, it_lst.widget().dataset)
+        elif vivisection == QtWidgets.QDialog.Rejected:
+            pass
+        else:
+            QtWidgets.QMessageBox.critical(self, "Critical error", "QDialog: Unexpected result")
 
     def addTable(self, lst, pattern):
         if pattern == 'f':
@@ -305,89 +1070,286 @@ class MainWindow(QtWidgets.QMainWindow):
         elif pattern == 't':
             self.openData(lst)
 
-    @QtCore.Slot(str, pandas.DataFrame)
+    @QtCore.Slot(str, object)
     def loadTable(self, name, data):
+        dataset = self.datasets.add(name.split('/')[-1], (data["two_theta"], data["intensity"]), meta=data.get("meta"))
+        with fishcore.PROFILER.stage("table window", dataset.count, file=dataset.name):
+            tableWidget = TableWidget(self, name)
+            tableWidget.set_Dataset(dataset)
+            self.loadSubWindow(tableWidget)
+
+    @QtCore.Slot(str, object, object)
+    def slot_streamOpened(self, name, stream, meta):
+        dataset = self.datasets.add(name.split('/')[-1], (stream.two_theta, stream.intensity), meta=meta, count=0)
         tableWidget = TableWidget(self, name)
-        tableWidget.set_Data(data)
-        tableWidget.actionPlot.triggered.connect(self.loadPlot)
+        tableWidget.set_Dataset(dataset)
         self.loadSubWindow(tableWidget)
+        plotWidget = PlotWidget(self, tableWidget.name)
+        plotWidget.set_Datasets([dataset], [tableWidget.name])
+        self.loadSubWindow(plotWidget)
+        self.streams[stream] = dataset
+
+    @QtCore.Slot(object, int, bool)
+    def slot_streamed(self, stream, count, done):
+        dataset = self.streams[stream]
+        if done:
+            del self.streams[stream]
+        if dataset.columns[0] is stream.two_theta:
+            dataset.extend(count)
+        else:
+            dataset.replace((stream.two_theta, stream.intensity), count)
+        self.refreshViews(dataset)
+
+    def followFile(self, file_name, separator, min_A, step, calibration=None):
+        sett = QtCore.QSettings(PROGRAM_PATH + "/settings.ini", QtCore.QSettings.IniFormat)
+        calibration = calibration or fishcore.DRON_2
+        follower = FishFollower(file_name, separator, min_A, step, int(sett.value("Follow/interval_ms", 1000)), self, calibration)
+        follower.updated.connect(self.slot_followed)
+        follower.errorSignal.connect(self.errors_loadTable)
+        meta = {'file': file_name, 'separator': separator, 'start': float(min_A), 'step': float(step), 'calibration': calibration.name}
+        dataset = self.datasets.add(file_name.split('/')[-1], (follower.live.two_theta, follower.live.intensity), meta=meta, count=0)
+        tableWidget = TableWidget(self, file_name)
+        tableWidget.set_Dataset(dataset)
+        tableWidget.follower = follower
+        tableWidget.destroyed.connect(follower.stop)
+        tableWidget.destroyed.connect(follower.deleteLater)
+        tableWidget.destroyed.connect(lambda obj=None, follower=follower: self.followers.pop(follower, None))
+        self.loadSubWindow(tableWidget)
+        plotWidget = PlotWidget(self, tableWidget.name)
+        plotWidget.set_Datasets([dataset], [tableWidget.name])
+        self.loadSubWindow(plotWidget)
+        self.followers[follower] = dataset
+        follower.start()
+
+    @QtCore.Slot(object, int)
+    def slot_followed(self, live, count):
+        dataset = self.followers.get(self.sender())
+        if dataset is None:
+            return
+        dataset.extend(count, (live.two_theta, live.intensity))
+        self.refreshViews(dataset)
 
     @QtCore.Slot(str)
     def errors_loadTable(self, err):
         QtWidgets.QMessageBox.critical(self, "Critical error", err)
 
     def readData(self, data):
-        self.thread = QtCore.QThread()
-        self.worker = FishThread(data[0], data[1], data[2], data[3])
-        self.worker.moveToThread(self.thread)
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.loadTable)
-        self.worker.errorSignal.connect(self.errors_loadTable)
-        self.worker.quit.connect(self.thread.quit)
-        self.thread.start()
+        calibration = self.get_Calibrations().get(data[7], fishcore.DRON_2)
+        if data[5]:
+            for file_name in data[0]:
+                self.followFile(file_name, data[1], data[2], data[6], calibration)
+            return
+        for file_name in data[0]:
+            worker = FishThread(file_name, data[1], data[2], data[3], data[4], self.get_Cache(), calibration)
+            worker.finished.connect(self.loadTable)
+            worker.opened.connect(self.slot_streamOpened)
+            worker.streamed.connect(self.slot_streamed)
+            worker.errorSignal.connect(self.errors_loadTable)
+            worker.quit.connect(self.slot_importDone)
+            self.workers.append(worker)
+            self.threadPool.start(FishTask(worker))
+        self.importTotal += len(data[0])
+        self.updateImportProgress()
+
+    def get_Cache(self):
+        sett = QtCore.QSettings(PROGRAM_PATH + "/settings.ini", QtCore.QSettings.IniFormat)
+        if sett.value("Cache/enabled", "true") != "true":
+            return None
+        if self.cache is None:
+            self.cache = fishcore.PatternCache(PROGRAM_PATH + "/cache", int(sett.value("Cache/max_size_mb", 512)) << 20)
+        return self.cache
+
+    @QtCore.Slot()
+    def slot_clearCache(self):
+        try:
+            fishcore.PatternCache(PROGRAM_PATH + "/cache", 0).clear()
+        except Exception:
+            QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+
+    @QtCore.Slot()
+    def slot_importDone(self):
+        worker = self.sender()
+        self.workers.remove(worker)
+        dataset = self.streams.pop(worker.openStream, None)
+        if dataset is not None:
+            dataset.meta['incomplete'] = True
+            dataset.replace([numpy.array(it) for it in dataset.data()])
+            for title in self.views.get(dataset.id, ()):
+                self.windows[title].setToolTip("Incomplete: " + dataset.name + " could not be read to the end")
+            self.refreshViews(dataset)
+        self.importDone += 1
+        if self.importDone == self.importTotal:
+            self.importTotal = 0
+            self.importDone = 0
+        self.updateImportProgress()
+
+    def updateImportProgress(self):
+        if self.importTotal == 0:
+            self.progressBar.hide()
+            self.statusBar().clearMessage()
+            return
+        self.progressBar.setRange(0, self.importTotal)
+        self.progressBar.setValue(self.importDone)
+        self.progressBar.show()
+        self.statusBar().showMessage("Converting files: " + str(self.importDone) + " / " + str(self.importTotal))
 
     def openData(self, data):
         try:
             file_name = data[0]
-            data = pandas.read_csv(file_name, sep=data[1])
+            import pandas
+
+            table = pandas.read_csv(file_name, sep=data[1])
+            data = {'two_theta': table["two_theta"].to_numpy(), 'intensity': table["intensity"].to_numpy(), 'meta': {'file': file_name, 'separator': data[1]}}
         except Exception:
             QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
         else:
             self.loadTable(file_name, data)
 
 
-class TableWidget(QtWidgets.QWidget):
-    actionPlot = QtWidgets.QAction("Plot")
+class PatternModel(QtCore.QAbstractTableModel):
+    def __init__(self, dataset, headers, parent=None):
+        super().__init__(parent)
+        self.dataset = dataset
+        self.headers = headers
+        self.count = dataset.count
+        self.revision = dataset.revision
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.count
+
+    def refresh(self):
+        if self.dataset.replaced > self.revision:
+            self.beginResetModel()
+            self.count = self.dataset.count
+            self.endResetModel()
+        elif self.dataset.count > self.count:
+            self.beginInsertRows(QtCore.QModelIndex(), self.count, self.dataset.count - 1)
+            self.count = self.dataset.count
+            self.endInsertRows()
+        self.revision = self.dataset.revision
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.dataset.columns)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and index.isValid():
+            return str(self.dataset.columns[index.column()][index.row()])
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.headers[section]
+        return str(section + 1)
+
 
-    def __init__(self, parent, name):
+class TableWidget(QtWidgets.QWidget):
+    def __init__(self, parent, name, lazy=False):
         super().__init__(parent)
 
         global ResTableWidgetID
         ResTableWidgetID += 1
+        self.mainWindow = parent
         self.name = name.split('/')[-1]
 
         self.resize(300, 500)
         self.setWindowIcon(QtGui.QIcon(PROGRAM_PATH + "/img/table.png"))
         self.setWindowTitle("Table " + str(ResTableWidgetID) + ": " + self.name)
 
-        self.tableWidget = QtWidgets.QTableWidget()
+        self.tableView = None
+        self.model = None
+        self.dataset = None
+        self.headers = None
+        self.follower = None
+        self.selectionPlots = []
+
+        self.actionPlot = QtWidgets.QAction("Plot", self)
+        self.actionPlot.triggered.connect(self.slot_plotSelection)
+
+        self.selectionTimer = QtCore.QTimer(self)
+        self.selectionTimer.setSingleShot(True)
+        self.selectionTimer.setInterval(50)
+        self.selectionTimer.timeout.connect(self.slot_selectionChanged)
+
+        if not lazy:
+            self.build()
+
+    def build(self):
+        if self.tableView is not None:
+            return
+        self.tableView = QtWidgets.QTableView()
 
         gridLayout = QtWidgets.QGridLayout()
-        gridLayout.addWidget(self.tableWidget, 0, 0)
+        gridLayout.addWidget(self.tableView, 0, 0)
         gridLayout.setMargin(0)
 
         self.setLayout(gridLayout)
 
-        for w in (self.tableWidget.horizontalHeader(), self.tableWidget):
+        for w in (self.tableView.horizontalHeader(), self.tableView):
             w.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
             w.customContextMenuRequested.connect(self.showContextMenu)
 
-    def set_Data(self, data):
-        row = 0
-        for col in range(2):
-            self.tableWidget.insertColumn(col)
-        for it in range(len(data)):
-            self.tableWidget.insertRow(row)
-            self.tableWidget.setItem(row, 0, QtWidgets.QTableWidgetItem(str(data["two_theta"][row])))
-            self.tableWidget.setItem(row, 1, QtWidgets.QTableWidgetItem(str(data["intensity"][row])))
-            row += 1
-        self.tableWidget.setHorizontalHeaderItem(0, QtWidgets.QTableWidgetItem("2θ"))
-        self.tableWidget.setHorizontalHeaderItem(1, QtWidgets.QTableWidgetItem("Intensity"))
+        if self.dataset is not None:
+            self.set_Model(PatternModel(self.dataset, self.headers, self))
+
+    def set_Model(self, model):
+        self.model = model
+        self.tableView.setModel(model)
+        self.tableView.selectionModel().selectionChanged.connect(self.selectionTimer.start)
+
+    def paintEvent(self, event):
+        if self.tableView is None:
+            QtCore.QTimer.singleShot(0, self.build)
+        super().paintEvent(event)
+
+    def set_Dataset(self, dataset, headers=("2θ", "Intensity")):
+        self.dataset = dataset
+        self.headers = headers
+        if self.tableView is not None:
+            self.set_Model(PatternModel(dataset, headers, self))
+        self.mainWindow.attachView(self.windowTitle(), dataset.id)
+
+    def refresh_Dataset(self, dataset):
+        if self.model is not None:
+            self.model.refresh()
+
+    def get_State(self):
+        return {'type': "table", 'name': self.name, 'dataset': self.dataset.id, 'headers': list(self.headers)}
+
+    @QtCore.Slot()
+    def slot_stopFollowing(self):
+        self.follower.stop()
+        self.follower = None
+
+    def get_Ranges(self):
+        if self.tableView is None or self.tableView.selectionModel() is None:
+            return []
+        return [(it.top(), it.bottom() + 1) for it in self.tableView.selectionModel().selection()]
 
     def get_Data(self):
-        data = [[], []]
-        si = self.tableWidget.selectionModel().selectedIndexes()
-        for it in range(len(self.tableWidget.selectionModel().selectedRows())):
-            data[0].append(float(self.tableWidget.item(si[it*2].row(), 0).text()))
-            data[1].append(float(self.tableWidget.item(si[it*2+1].row(), 1).text()))
-        return [data, self.name]
+        columns = self.dataset.data()
+        return [fishcore.selectRows(columns[:2], self.get_Ranges()), self.name]
 
-    def get_AllData(self):
-        data = [[], []]
-        for i in range(self.tableWidget.rowCount()):
-            data[0].append(float(self.tableWidget.item(i,0).text()))
-            data[1].append(float(self.tableWidget.item(i,1).text()))
-        return data
+    @QtCore.Slot()
+    def slot_plotSelection(self):
+        self.mainWindow.plotSelection(self)
+
+    @QtCore.Slot()
+    def slot_selectionChanged(self):
+        if not self.selectionPlots:
+            return
+        data = self.get_Data()[0]
+        titles = []
+        for title in self.selectionPlots:
+            window = self.mainWindow.findWindow(title)
+            if window is not None and window.widget().update_Selection(self.name, data):
+                titles.append(title)
+        self.selectionPlots = titles
 
     @QtCore.Slot()
     def showContextMenu(self, pos):
@@ -395,16 +1357,13 @@ class TableWidget(QtWidgets.QWidget):
         pos = table.viewport().mapToGlobal(pos)
         menu = QtWidgets.QMenu()
         menu.addAction(self.actionPlot)
+        if self.follower is not None:
+            menu.addAction("Stop following", self.slot_stopFollowing)
         menu.exec_(pos)
 
     def Save(self, file, delimiter):
         try:
-            data = [[], []]
-            for i in range(self.tableWidget.rowCount()):
-                data[0].append(float(self.tableWidget.item(i,0).text()))
-                data[1].append(float(self.tableWidget.item(i,1).text()))
-            data = pandas.DataFrame({"two_theta": data[0], "intensity": data[1]})
-            data.to_csv(file,index=False,sep=delimiter,header=True)
+            fishcore.saveColumns(file, self.dataset.data(), self.dataset.names, delimiter)
         except Exception:
             QtWidgets.QMessageBox.critical(self, "Save", traceback.format_exc())
 
@@ -494,20 +1453,44 @@ class DialogOpenTable(QtWidgets.QDialog):
 
 
 class PlotWidget(QtWidgets.QWidget):
-    def __init__(self, parent, title=''):
+    def __init__(self, parent, title='', lazy=False):
         super().__init__(parent)
 
         global ResPlotWidgetID
         ResPlotWidgetID += 1
 
+        self.mainWindow = parent
+        self.title = title
+        self.sources = {}
+        self.sc = None
+        self.pending = []
+
         self.resize(600, 500)
         self.setWindowIcon(QtGui.QIcon(PROGRAM_PATH + "/img/plot.png"))
         self.setWindowTitle("Plot " + str(ResPlotWidgetID) + ": " + title)
 
+        if not lazy:
+            self.build()
+
+    def build(self):
+        if self.sc is not None:
+            return
         vBoxLayout = QtWidgets.QVBoxLayout()
 
-        self.sc = PlotCanvas(self, width=5, height=4, dpi=100)
-        toolbar = NavigationToolbar(self.sc, self)
+        start = time.perf_counter()
+        import fishplot
+
+        self.sc = fishplot.PlotCanvas(self, width=5, height=4, dpi=100)
+        toolbar = fishplot.NavigationToolbar(self.sc, self)
+
+        self.menuPatterns = QtWidgets.QMenu(self)
+        self.menuPatterns.aboutToShow.connect(self.slot_showPatternsMenu)
+        toolButtonPatterns = QtWidgets.QToolButton()
+        toolButtonPatterns.setText("Patterns")
+        toolButtonPatterns.setMenu(self.menuPatterns)
+        toolButtonPatterns.setPopupMode(QtWidgets.QToolButton.InstantPopup)
+        toolbar.addSeparator()
+        toolbar.addWidget(toolButtonPatterns)
 
         vBoxLayout.addWidget(toolbar)
         vBoxLayout.addWidget(self.sc)
@@ -515,73 +1498,248 @@ class PlotWidget(QtWidgets.QWidget):
 
         self.setLayout(vBoxLayout)
 
-    def set_Data(self, data):
-        self.sc.update_figure(data)
+        for key, dataset, data, style in self.pending:
+            if dataset is not None:
+                data = dataset.data()
+            self.sc.add_series(key, data[0], data[1], False, **style)
+        self.pending = []
+        self.sc.redraw(True)
+        startupTime("build " + self.windowTitle(), start)
+
+    def paintEvent(self, event):
+        if self.sc is None:
+            QtCore.QTimer.singleShot(0, self.build)
+        super().paintEvent(event)
+
+    def restore_Series(self, series):
+        for key, dataset, data, style in series:
+            if dataset is not None:
+                self.sources[key] = dataset.id
+                self.mainWindow.attachView(self.windowTitle(), dataset.id)
+        if self.sc is None:
+            self.pending = list(series)
+            return
+        for key, dataset, data, style in series:
+            if dataset is not None:
+                data = dataset.data()
+            self.sc.add_series(key, data[0], data[1], False, **style)
+        self.sc.redraw(True)
+
+    def get_State(self, arrays):
+        series = []
+        if self.sc is None:
+            items = [(key, data, style) for key, dataset, data, style in self.pending]
+        else:
+            items = [(key, (x, y), self.sc.styles.get(key, {})) for key, (line, x, y, monotonic) in self.sc.series.items()]
+        for key, data, style in items:
+            if key in self.sources:
+                series.append({'key': key, 'dataset': self.sources[key]})
+            else:
+                arrays.extend(data[:2])
+                series.append({'key': key, 'columns': [len(arrays) - 2, len(arrays) - 1], 'style': style})
+        return {'type': "plot", 'name': self.title, 'series': series}
+
+    def release_Mapping(self, mapping):
+        if self.sc is None:
+            self.pending = [(key, dataset, data if dataset is not None or fishcore.sessionMapping(data[0]) is not mapping else [numpy.array(it) for it in data], style)
+                            for key, dataset, data, style in self.pending]
+            return
+        for key, (line, x, y, monotonic) in self.sc.series.items():
+            if key not in self.sources and fishcore.sessionMapping(x) is mapping:
+                self.sc.update_series(key, numpy.array(x), numpy.array(y), False)
 
-    def set_serialData(self, listData):
-        self.sc.update_serialFigure(listData)
+    def set_Data(self, data):
+        self.detach_Datasets()
+        self.sc.update_figure(data, self.title)
+
+    def update_Selection(self, key, data):
+        if self.sc is None or key not in self.sc.series:
+            return False
+        self.sc.add_series(key, data[0], data[1])
+        return True
+
+    def set_Datasets(self, datasets, keys):
+        old = set(self.sources.values())
+        self.sources = {key: dataset.id for key, dataset in zip(keys, datasets)}
+        for id in set(self.sources.values()):
+            self.mainWindow.attachView(self.windowTitle(), id)
+        for id in old - set(self.sources.values()):
+            self.mainWindow.detachView(self.windowTitle(), id)
+        self.sc.update_serialFigure([it.data()[:2] for it in datasets], keys)
+
+    def add_Dataset(self, key, dataset):
+        self.sources[key] = dataset.id
+        self.mainWindow.attachView(self.windowTitle(), dataset.id)
+        self.sc.add_series(key, *dataset.data()[:2])
+
+    def refresh_Dataset(self, dataset):
+        if self.sc is None:
+            return
+        for key, id in self.sources.items():
+            if id == dataset.id:
+                self.sc.add_series(key, *dataset.data()[:2])
 
-    def Save(self,file):
-        try:
-            self.sc.print_figure(filename=file, dpi=300)
-        except Exception:
-            QtWidgets.QMessageBox.critical(self, "Save", traceback.format_exc())
+    def detach_Datasets(self):
+        for id in set(self.sources.values()):
+            self.mainWindow.detachView(self.windowTitle(), id)
+        self.sources.clear()
 
+    def set_Markers(self, key, x, y):
+        self.sc.add_series(key, x, y, linestyle="none", marker="v", color="red")
 
-class NavigationToolbar(NavigationToolbar2QT):
-    toolitems = [t for t in NavigationToolbar2QT.toolitems if t[0] in ('Pan', 'Zoom', 'Subplots', 'Customize', 'Save')]
+    def set_Curve(self, key, x, y, color):
+        self.sc.add_series(key, x, y, linestyle="-", marker="", color=color)
 
+    def set_Sticks(self, key, x, y, color):
+        x = numpy.repeat(numpy.asarray(x, dtype=numpy.float64), 3)
+        y = numpy.column_stack((numpy.zeros(len(y)), y, numpy.full(len(y), numpy.nan))).ravel()
+        self.sc.add_series(key, x, y, linestyle="-", marker="", color=color)
 
-class plotCanvas(FigureCanvas):
-    def __init__(self, parent=None, width=5, height=4, dpi=100):
-        self.fig = Figure(figsize=(width, height), dpi=dpi)
-        self.axes = self.fig.add_subplot(111)
+    def get_Patterns(self):
+        return list(self.sc.series)
 
-        self.compute_initial_figure()
+    def add_Pattern(self, key, data):
+        self.sc.add_series(key, data[0], data[1])
 
-        super().__init__(self.fig)
-        self.setParent(parent)
+    def remove_Pattern(self, key):
+        id = self.sources.pop(key, None)
+        if id is not None and id not in self.sources.values():
+            self.mainWindow.detachView(self.windowTitle(), id)
+        self.sc.remove_series(key)
 
-        super().updateGeometry()
+    def toggle_Pattern(self, key, visible=None):
+        if visible is None:
+            visible = not self.sc.series[key][0].get_visible()
+        self.sc.set_seriesVisible(key, visible)
 
-    def compute_initial_figure(self):
-        pass
+    @QtCore.Slot()
+    def slot_showPatternsMenu(self):
+        self.menuPatterns.clear()
+        for key, series in self.sc.series.items():
+            action = self.menuPatterns.addAction(key)
+            action.setCheckable(True)
+            action.setChecked(series[0].get_visible())
+            action.toggled.connect(lambda checked, key=key: self.toggle_Pattern(key, checked))
+        self.menuPatterns.addSeparator()
+        self.menuPatterns.addAction("Add/remove patterns...", lambda: self.mainWindow.editPlot(self))
+
+
+class SeriesWidget(QtWidgets.QWidget):
+    def __init__(self, parent, title='', lazy=False):
+        super().__init__(parent)
 
+        global ResPlotWidgetID
+        ResPlotWidgetID += 1
 
-class PlotCanvas(plotCanvas):
-    def __init__(self, *args, **kwargs):
-        plotCanvas.__init__(self, *args, **kwargs)
+        self.mainWindow = parent
+        self.title = title
+        self.sources = {}
+        self.sc = None
+        self.mode = "heatmap"
+        self.axis = "order"
+        self.offset = 0.1
+        self.log = False
 
-    def compute_initial_figure(self):
-        pass
+        self.resize(600, 500)
+        self.setWindowIcon(QtGui.QIcon(PROGRAM_PATH + "/img/plot.png"))
+        self.setWindowTitle("Plot " + str(ResPlotWidgetID) + ": " + title)
 
-    def update_figure(self, data):
-        self.axes.cla()
-        self.axes.plot(data[0], data[1])
+        self.refreshTimer = QtCore.QTimer(self)
+        self.refreshTimer.setSingleShot(True)
+        self.refreshTimer.setInterval(100)
+        self.refreshTimer.timeout.connect(self.update_Series)
 
-        self.axes.set_xlabel("2θ, °")
-        self.axes.set_ylabel("Intensity")
+        if not lazy:
+            self.build()
 
-        self.axes.get_yaxis().set_ticks([])
+    def build(self):
+        if self.sc is not None:
+            return
+        import fishplot
+
+        self.sc = fishplot.SeriesCanvas(self, width=5, height=4, dpi=100)
+        toolbar = fishplot.NavigationToolbar(self.sc, self)
+
+        self.comboBoxMode = QtWidgets.QComboBox()
+        self.comboBoxMode.addItems(("Heat map", "Waterfall"))
+        self.comboBoxMode.setCurrentIndex(SERIES_MODES.index(self.mode))
+        self.comboBoxMode.currentIndexChanged.connect(self.slot_modeChanged)
+        self.checkBoxLog = QtWidgets.QCheckBox("Log")
+        self.checkBoxLog.setChecked(self.log)
+        self.checkBoxLog.toggled.connect(self.slot_modeChanged)
+        toolbar.addSeparator()
+        toolbar.addWidget(self.comboBoxMode)
+        toolbar.addWidget(self.checkBoxLog)
 
-        self.draw()
+        vBoxLayout = QtWidgets.QVBoxLayout()
+        vBoxLayout.addWidget(toolbar)
+        vBoxLayout.addWidget(self.sc)
+        vBoxLayout.setMargin(0)
 
-    def update_serialFigure(self, listData):
-        self.axes.cla()
+        self.setLayout(vBoxLayout)
 
-        for data in listData:
-            self.axes.plot(data[0], data[1])
+        self.sc.set_Mode(self.mode, self.offset, self.log)
+        if self.sources:
+            self.update_Series()
+
+    def paintEvent(self, event):
+        if self.sc is None:
+            QtCore.QTimer.singleShot(0, self.build)
+        super().paintEvent(event)
+
+    def set_Options(self, mode, axis, offset, log):
+        self.mode = mode
+        self.axis = axis
+        self.offset = offset
+        self.log = log
+
+    def set_Datasets(self, datasets, keys):
+        self.sources = {key: dataset.id for key, dataset in zip(keys, datasets)}
+        for id in set(self.sources.values()):
+            self.mainWindow.attachView(self.windowTitle(), id)
+        if self.sc is not None:
+            self.update_Series()
+
+    def detach_Datasets(self):
+        for id in set(self.sources.values()):
+            self.mainWindow.detachView(self.windowTitle(), id)
+        self.sources.clear()
+
+    def refresh_Dataset(self, dataset):
+        if self.sc is not None:
+            self.refreshTimer.start()
+
+    def get_Values(self, datasets):
+        if self.axis == "name":
+            values = []
+            for i, dataset in enumerate(datasets):
+                match = re.search(r"[-+]?\d+(?:\.\d+)?", dataset.name)
+                values.append(float(match.group()) if match else float(i))
+            return numpy.array(values), "Value in name"
+        return numpy.arange(len(datasets), dtype=numpy.float64), "Pattern"
 
-        self.axes.set_xlabel("2θ, °")
-        self.axes.set_ylabel("Intensity")
+    @QtCore.Slot()
+    def update_Series(self):
+        datasets = [self.mainWindow.datasets.get(id) for id in self.sources.values()]
+        grid, matrix = self.mainWindow.resampleDatasets(datasets)
+        values, label = self.get_Values(datasets)
+        order = numpy.argsort(values, kind="stable")
+        with fishcore.PROFILER.stage("series plot", matrix.size, patterns=len(datasets)):
+            self.sc.set_Series(grid, matrix[order], values[order], label)
 
-        self.axes.get_yaxis().set_ticks([])
+    @QtCore.Slot()
+    def slot_modeChanged(self):
+        self.mode = SERIES_MODES[self.comboBoxMode.currentIndex()]
+        self.log = self.checkBoxLog.isChecked()
+        self.sc.set_Mode(self.mode, self.offset, self.log)
 
-        self.draw()
+    def get_State(self):
+        return {'type': "series", 'name': self.title, 'datasets': list(self.sources.values()), 'keys': list(self.sources),
+                'mode': self.mode, 'axis': self.axis, 'offset': self.offset, 'log': self.log}
 
 
 class BuildPlotDialog(QtWidgets.QDialog):
-    def __init__(self, parent, lst):
+    def __init__(self, parent, lst, checked=()):
         super().__init__(parent)
         self.resize(450, 200)
         self.setWindowTitle("Plot")
@@ -594,6 +1752,7 @@ class BuildPlotDialog(QtWidgets.QDialog):
         layout = QtWidgets.QVBoxLayout()
         for it_lst in lst:
             radioButton = QtWidgets.QCheckBox(it_lst.widget().windowTitle())
+            radioButton.setChecked(it_lst.widget().windowTitle() in checked)
             layout.addWidget(radioButton)
         self.groupBox.setLayout(layout)
         scrollArea.setWidget(self.groupBox)
@@ -616,12 +1775,378 @@ class BuildPlotDialog(QtWidgets.QDialog):
         return items
 
 
+class DialogTables(QtWidgets.QDialog):
+    def __init__(self, parent, title, lst):
+        super().__init__(parent)
+        self.resize(450, 350)
+        self.setWindowTitle(title)
+
+        self.sett = QtCore.QSettings(PROGRAM_PATH + "/settings.ini", QtCore.QSettings.IniFormat)
+
+        self.groupBox = QtWidgets.QGroupBox("Tables")
+        self.groupBox.setFlat(True)
+        layout = QtWidgets.QVBoxLayout()
+        for it_lst in lst:
+            checkBox = QtWidgets.QCheckBox(it_lst.widget().windowTitle())
+            layout.addWidget(checkBox)
+        self.groupBox.setLayout(layout)
+        scrollArea = QtWidgets.QScrollArea()
+        scrollArea.setWidget(self.groupBox)
+        scrollArea.setWidgetResizable(True)
+
+        self.formLayout = QtWidgets.QFormLayout()
+
+        self.buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
+        self.buttonBox.accepted.connect(self.accept)
+        self.buttonBox.rejected.connect(self.reject)
+
+        self.vBoxLayout = QtWidgets.QVBoxLayout()
+        self.vBoxLayout.addWidget(scrollArea)
+        self.vBoxLayout.addLayout(self.formLayout)
+        self.vBoxLayout.addWidget(self.buttonBox)
+
+        self.setLayout(self.vBoxLayout)
+
+    def add_SpinBox(self, label, key, default, minimum, maximum, decimals=3, step=1.0):
+        spinBox = QtWidgets.QDoubleSpinBox()
+        spinBox.setDecimals(decimals)
+        spinBox.setRange(minimum, maximum)
+        spinBox.setSingleStep(step)
+        spinBox.setValue(float(self.sett.value(key, default)))
+        spinBox.setObjectName(key)
+        self.formLayout.addRow(label, spinBox)
+        return spinBox
+
+    def add_ComboBox(self, label, key, items):
+        comboBox = QtWidgets.QComboBox()
+        comboBox.addItems(items)
+        comboBox.setCurrentIndex(min(int(self.sett.value(key, 0)), len(items) - 1))
+        comboBox.setObjectName(key)
+        self.formLayout.addRow(label, comboBox)
+        return comboBox
+
+    def add_CheckBox(self, label, key, default=True):
+        checkBox = QtWidgets.QCheckBox(label)
+        checkBox.setChecked(self.sett.value(key, "true" if default else "false") == "true")
+        checkBox.setObjectName(key)
+        self.formLayout.addRow(checkBox)
+        return checkBox
+
+    def add_Anode(self, key):
+        items = [it + " Kα1 (" + str(fishcore.ANODES[it][0]) + " Å)" for it in fishcore.ANODES]
+        return self.add_ComboBox("Anode", key, items)
+
+    def get_Anode(self, comboBox):
+        return fishcore.ANODES[list(fishcore.ANODES)[comboBox.currentIndex()]]
+
+    def get_Tables(self):
+        items = []
+        for checkbox in self.groupBox.findChildren(QtWidgets.QCheckBox):
+            if checkbox.isChecked():
+                items.append(checkbox.text())
+        return items
+
+    def save_Settings(self):
+        for w in self.findChildren(QtWidgets.QDoubleSpinBox):
+            self.sett.setValue(w.objectName(), w.value())
+        for w in self.findChildren(QtWidgets.QComboBox):
+            self.sett.setValue(w.objectName(), w.currentIndex())
+        for w in self.findChildren(QtWidgets.QCheckBox):
+            if w.objectName():
+                self.sett.setValue(w.objectName(), w.isChecked())
+
+    @QtCore.Slot()
+    def accept(self):
+        if not self.get_Tables():
+            QtWidgets.QMessageBox.warning(self, "Warning", "Select at least one table")
+            return
+
+        super().accept()
+
+
+class DialogPeaks(DialogTables):
+    def __init__(self, parent, lst):
+        super().__init__(parent, "Find peaks", lst)
+
+        self.comboBoxAnode = self.add_Anode("DialogPeaks/anode")
+        self.spinBoxHeight = self.add_SpinBox("Minimum height, %", "DialogPeaks/min_height", 5, 0, 100, 1)
+        self.spinBoxSeparation = self.add_SpinBox("Minimum separation, °", "DialogPeaks/separation", 0.1, 0.001, 10, 3, 0.01)
+        self.checkBoxPlot = self.add_CheckBox("Show peaks on plots", "DialogPeaks/plot")
+
+    def getInput(self):
+        self.save_Settings()
+        return [self.get_Tables(), self.get_Anode(self.comboBoxAnode)[0], self.spinBoxHeight.value() / 100, self.spinBoxSeparation.value(), self.checkBoxPlot.isChecked()]
+
+
+class DialogSmooth(DialogTables):
+    def __init__(self, parent, lst):
+        super().__init__(parent, "Smooth", lst)
+
+        self.comboBoxMethod = self.add_ComboBox("Method", "DialogSmooth/method", ("Savitzky–Golay", "Moving average"))
+        self.spinBoxWindow = self.add_SpinBox("Window, points", "DialogSmooth/window", 11, 3, 9999, 0, 2)
+        self.spinBoxOrder = self.add_SpinBox("Polynomial order", "DialogSmooth/order", 3, 0, 10, 0)
+        self.checkBoxPlot = self.add_CheckBox("Build plots", "DialogSmooth/plot")
+        self.comboBoxMethod.currentIndexChanged.connect(lambda index: self.spinBoxOrder.setEnabled(index == 0))
+        self.spinBoxOrder.setEnabled(self.comboBoxMethod.currentIndex() == 0)
+
+    def getInput(self):
+        self.save_Settings()
+        window = int(self.spinBoxWindow.value()) // 2 * 2 + 1
+        if self.comboBoxMethod.currentIndex() == 0:
+            order = int(self.spinBoxOrder.value())
+            return [self.get_Tables(), "savgol", (window, order), "SG " + str(window) + "/" + str(order), self.checkBoxPlot.isChecked()]
+        return [self.get_Tables(), "average", (window,), "MA " + str(window), self.checkBoxPlot.isChecked()]
+
+
+class DialogBackground(DialogTables):
+    def __init__(self, parent, lst):
+        super().__init__(parent, "Subtract background", lst)
+
+        self.comboBoxMethod = self.add_ComboBox("Method", "DialogBackground/method", ("Polynomial", "SNIP"))
+        self.spinBoxOrder = self.add_SpinBox("Polynomial order", "DialogBackground/order", 3, 0, 10, 0)
+        self.spinBoxIterations = self.add_SpinBox("SNIP iterations", "DialogBackground/iterations", 100, 1, 100000, 0)
+        self.checkBoxPlot = self.add_CheckBox("Build plots", "DialogBackground/plot")
+        self.comboBoxMethod.currentIndexChanged.connect(self.slot_methodChanged)
+        self.slot_methodChanged(self.comboBoxMethod.currentIndex())
+
+    @QtCore.Slot(int)
+    def slot_methodChanged(self, index):
+        self.spinBoxOrder.setEnabled(index == 0)
+        self.spinBoxIterations.setEnabled(index == 1)
+
+    def getInput(self):
+        self.save_Settings()
+        if self.comboBoxMethod.currentIndex() == 0:
+            order = int(self.spinBoxOrder.value())
+            return [self.get_Tables(), "polynomial", (order,), "Background poly " + str(order), self.checkBoxPlot.isChecked()]
+        iterations = int(self.spinBoxIterations.value())
+        return [self.get_Tables(), "snip", (iterations,), "Background SNIP " + str(iterations), self.checkBoxPlot.isChecked()]
+
+
+class DialogKa2(DialogTables):
+    def __init__(self, parent, lst):
+        super().__init__(parent, "Strip Kα2", lst)
+
+        self.comboBoxAnode = self.add_Anode("DialogKa2/anode")
+        self.spinBoxRatio = self.add_SpinBox("Intensity ratio Kα2/Kα1", "DialogKa2/ratio", 0.5, 0, 1, 3, 0.01)
+        self.checkBoxPlot = self.add_CheckBox("Build plots", "DialogKa2/plot")
+
+    def getInput(self):
+        self.save_Settings()
+        ka1, ka2 = self.get_Anode(self.comboBoxAnode)
+        anode = list(fishcore.ANODES)[self.comboBoxAnode.currentIndex()]
+        return [self.get_Tables(), "ka2", (ka1, ka2, self.spinBoxRatio.value()), "Kα2 stripped " + anode, self.checkBoxPlot.isChecked()]
+
+
+class DialogArithmetic(DialogTables):
+    def __init__(self, parent, lst):
+        super().__init__(parent, "Pattern arithmetic", lst)
+
+        self.comboBoxOperation = self.add_ComboBox("Operation", "DialogArithmetic/operation",
+                                                   ("Sum", "Mean", "Weighted mean (by noise)", "Difference (first − factor × others)", "Normalized mean (equal areas)"))
+        self.spinBoxStep = self.add_SpinBox("2θ step (0 = automatic)", "DialogArithmetic/step", 0, 0, 10, 4, 0.001)
+        self.spinBoxFactor = self.add_SpinBox("Difference factor", "DialogArithmetic/factor", 1, -1000, 1000, 4, 0.1)
+        self.checkBoxPlot = self.add_CheckBox("Build plot", "DialogArithmetic/plot")
+        self.comboBoxOperation.currentIndexChanged.connect(lambda index: self.spinBoxFactor.setEnabled(index == 3))
+        self.spinBoxFactor.setEnabled(self.comboBoxOperation.currentIndex() == 3)
+
+    def getInput(self):
+        self.save_Settings()
+        return [self.get_Tables(), fishcore.ARITHMETIC[self.comboBoxOperation.currentIndex()], self.spinBoxStep.value(), self.spinBoxFactor.value(), self.checkBoxPlot.isChecked()]
+
+
+class DialogSeries(DialogTables):
+    def __init__(self, parent, lst):
+        super().__init__(parent, "Build series plot", lst)
+
+        self.comboBoxMode = self.add_ComboBox("View", "DialogSeries/mode", ("Heat map", "Waterfall"))
+        self.comboBoxAxis = self.add_ComboBox("Vertical axis", "DialogSeries/axis", ("Pattern order", "Number in the name (temperature, time, ...)"))
+        self.spinBoxOffset = self.add_SpinBox("Waterfall offset (fraction of the pattern range)", "DialogSeries/offset", 0.1, 0, 10, 3, 0.05)
+        self.checkBoxLog = self.add_CheckBox("Logarithmic intensity", "DialogSeries/log", False)
+
+    def getInput(self):
+        self.save_Settings()
+        return [self.get_Tables(), SERIES_MODES[self.comboBoxMode.currentIndex()], ("order", "name")[self.comboBoxAxis.currentIndex()],
+                self.spinBoxOffset.value(), self.checkBoxLog.isChecked()]
+
+
+class DialogCalibration(DialogTables):
+    def __init__(self, parent, lst):
+        super().__init__(parent, "Apply calibration", lst)
+
+        self.comboBoxProfile = QtWidgets.QComboBox()
+        self.comboBoxProfile.addItems(list(parent.get_Calibrations()))
+        self.comboBoxProfile.setCurrentText(self.sett.value("DialogCalibration/profile", fishcore.DEFAULT_CALIBRATION))
+        pushButtonEdit = QtWidgets.QPushButton("Edit profiles")
+        pushButtonEdit.clicked.connect(self.slot_editProfiles)
+        hBoxLayout = QtWidgets.QHBoxLayout()
+        hBoxLayout.addWidget(self.comboBoxProfile)
+        hBoxLayout.addWidget(pushButtonEdit)
+        self.formLayout.addRow("Profile", hBoxLayout)
+
+    @QtCore.Slot()
+    def slot_editProfiles(self):
+        if not os.path.isfile(fishcore.CALIBRATION_FILE):
+            try:
+                fishcore.saveCalibrations(self.parent().get_Calibrations().values())
+            except Exception:
+                QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+                return
+        QtGui.QDesktopServices.openUrl(QtCore.QUrl.fromLocalFile(fishcore.CALIBRATION_FILE))
+
+    def getInput(self):
+        self.sett.setValue("DialogCalibration/profile", self.comboBoxProfile.currentText())
+        return [self.get_Tables(), self.comboBoxProfile.currentText()]
+
+
+class DialogSearchMatch(DialogTables):
+    def __init__(self, parent, lst):
+        super().__init__(parent, "Search–match", lst)
+
+        self.comboBoxAnode = self.add_Anode("DialogSearchMatch/anode")
+        self.spinBoxTolerance = self.add_SpinBox("Tolerance, °", "DialogSearchMatch/tolerance", 0.1, 0.001, 2, 3, 0.01)
+        self.spinBoxHeight = self.add_SpinBox("Minimum peak height, %", "DialogSearchMatch/min_height", 5, 0, 100, 1)
+        self.spinBoxCandidates = self.add_SpinBox("Candidates", "DialogSearchMatch/candidates", 20, 1, 500, 0)
+        pushButtonLibrary = QtWidgets.QPushButton("Open reference folder")
+        pushButtonLibrary.clicked.connect(self.slot_openLibrary)
+        self.formLayout.addRow(pushButtonLibrary)
+
+    @QtCore.Slot()
+    def slot_openLibrary(self):
+        try:
+            os.makedirs(fishcore.REFERENCE_DIRECTORY, exist_ok=True)
+        except Exception:
+            QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+            return
+        self.parent().references = None
+        QtGui.QDesktopServices.openUrl(QtCore.QUrl.fromLocalFile(fishcore.REFERENCE_DIRECTORY))
+
+    def getInput(self):
+        self.save_Settings()
+        return [self.get_Tables(), self.get_Anode(self.comboBoxAnode)[0], self.spinBoxTolerance.value(),
+                self.spinBoxHeight.value() / 100, int(self.spinBoxCandidates.value())]
+
+
+class SearchMatchDialog(QtWidgets.QDialog):
+    def __init__(self, parent, name, pattern, peaks, wavelength, library, results):
+        super().__init__(parent)
+        self.resize(650, 400)
+        self.setWindowTitle("Search–match: " + name)
+
+        self.mainWindow = parent
+        self.name = name
+        self.pattern = pattern
+        self.peaks = peaks
+        self.wavelength = wavelength
+        self.library = library
+        self.results = results
+        self.plotTitle = None
+
+        label = QtWidgets.QLabel(str(len(peaks[0])) + " peaks, " + str(len(library)) + " reference cards, " + str(len(results)) + " candidates")
+
+        self.tableWidget = QtWidgets.QTableWidget(len(results), 5)
+        self.tableWidget.setHorizontalHeaderLabels(("Phase", "Formula", "Score", "Peaks explained, %", "Lines matched, %"))
+        self.tableWidget.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.tableWidget.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        for row, it in enumerate(results):
+            texts = (it['name'], it['formula'], "%.3f" % it['score'], "%.1f" % (100 * it['explained']), "%.1f" % (100 * it['matched']))
+            for column, text in enumerate(texts):
+                self.tableWidget.setItem(row, column, QtWidgets.QTableWidgetItem(text))
+        self.tableWidget.resizeColumnsToContents()
+        self.tableWidget.itemDoubleClicked.connect(self.slot_showSticks)
+
+        buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Close)
+        pushButtonSticks = buttonBox.addButton("Show sticks", QtWidgets.QDialogButtonBox.ActionRole)
+        pushButtonSticks.clicked.connect(self.slot_showSticks)
+        buttonBox.rejected.connect(self.reject)
+
+        vBoxLayout = QtWidgets.QVBoxLayout()
+        vBoxLayout.addWidget(label)
+        vBoxLayout.addWidget(self.tableWidget)
+        vBoxLayout.addWidget(buttonBox)
+        self.setLayout(vBoxLayout)
+
+    def get_Plot(self):
+        window = self.mainWindow.findWindow(self.plotTitle) if self.plotTitle else None
+        if window is not None:
+            return window.widget()
+        plotWidget = PlotWidget(self.mainWindow, self.name)
+        if self.pattern is not None and self.pattern.id in self.mainWindow.datasets:
+            plotWidget.set_Datasets([self.pattern], [self.pattern.name])
+        if len(self.peaks[0]):
+            plotWidget.set_Markers("Peaks", *self.peaks)
+        self.mainWindow.loadSubWindow(plotWidget)
+        self.plotTitle = plotWidget.windowTitle()
+        return plotWidget
+
+    @QtCore.Slot()
+    def slot_showSticks(self):
+        rows = sorted({it.row() for it in self.tableWidget.selectedIndexes()})
+        if not rows:
+            return
+        plotWidget = self.get_Plot()
+        two_theta, heights = self.pattern.data()[:2] if self.pattern is not None else self.peaks
+        if not len(heights):
+            return
+        scale = float(numpy.nanmax(heights)) / 100
+        for row in rows:
+            it = self.results[row]
+            x, y = self.library.sticks(it['card'], self.wavelength)
+            mask = (x >= numpy.nanmin(two_theta)) & (x <= numpy.nanmax(two_theta))
+            plotWidget.set_Sticks("Ref: " + it['name'], x[mask], y[mask] * scale, "C" + str(row % 9 + 1))
+
+
+class DialogFit(DialogTables):
+    def __init__(self, parent, lst):
+        super().__init__(parent, "Fit profiles", lst)
+
+        self.comboBoxProfile = self.add_ComboBox("Profile", "DialogFit/profile", fishcore.PROFILES)
+        self.lineEditRegions = QtWidgets.QLineEdit(self.sett.value("DialogFit/regions", "28-29.5; 33-34.5"))
+        self.lineEditRegions.setToolTip("2θ ranges as from-to, separated by semicolons")
+        self.formLayout.addRow("Regions, °", self.lineEditRegions)
+        self.spinBoxPeaks = self.add_SpinBox("Peaks per region", "DialogFit/peaks", 1, 1, 10, 0)
+        self.spinBoxOrder = self.add_SpinBox("Background order", "DialogFit/order", 1, 0, 5, 0)
+        self.spinBoxHeight = self.add_SpinBox("Minimum peak height, %", "DialogFit/min_height", 5, 0, 100, 1)
+        self.checkBoxPlot = self.add_CheckBox("Plot fits", "DialogFit/plot")
+
+    def get_Regions(self):
+        regions = []
+        for it in self.lineEditRegions.text().split(";"):
+            if not it.strip():
+                continue
+            match = re.fullmatch(r"\s*(\d+(?:\.\d*)?)\s*[-–]\s*(\d+(?:\.\d*)?)\s*", it)
+            if match is None:
+                return None
+            lo, hi = sorted((float(match.group(1)), float(match.group(2))))
+            if lo == hi:
+                return None
+            regions.append((lo, hi))
+        return regions or None
+
+    @QtCore.Slot()
+    def accept(self):
+        if self.get_Regions() is None:
+            QtWidgets.QMessageBox.warning(self, "Warning", "Enter the regions as from-to 2θ ranges separated by semicolons, e.g. 28-29.5; 33-34.5")
+            return
+
+        super().accept()
+
+    def getInput(self):
+        self.save_Settings()
+        self.sett.setValue("DialogFit/regions", self.lineEditRegions.text())
+        return [self.get_Tables(), fishcore.PROFILES[self.comboBoxProfile.currentIndex()], self.get_Regions(),
+                int(self.spinBoxPeaks.value()), int(self.spinBoxOrder.value()), self.spinBoxHeight.value() / 100, self.checkBoxPlot.isChecked()]
+
+
 class AboutProgramDialog(QtWidgets.QDialog):
     def __init__(self, parent):
         super().__init__(parent)
         self.resize(500, 400)
         self.setWindowTitle("About program")
 
+        import pandas
+        import matplotlib
+
         gridLayout = QtWidgets.QGridLayout()
 
         hLayout = QtWidgets.QHBoxLayout()
@@ -717,6 +2242,22 @@ class DialogOpenFile(QtWidgets.QDialog):
         elif vivisection == " ":
             self.comboBoxDelimiter.setCurrentIndex(3)
 
+        self.checkBoxStream = QtWidgets.QCheckBox("Read in chunks (large files)")
+        self.checkBoxStream.setChecked(self.sett.value("DialogOpenFile/stream") == "true")
+
+        self.checkBoxFollow = QtWidgets.QCheckBox("Follow file while it is being written")
+        self.checkBoxFollow.setChecked(self.sett.value("DialogOpenFile/follow") == "true")
+        self.checkBoxFollow.toggled.connect(self.slot_followToggled)
+        self.labelTwoThetaStep = QtWidgets.QLabel("<html><head/><body><p align=\"right\">2θ<span style=\" vertical-align:sub;\">step</span>:</p></body></html>")
+        self.lineEditTwoThetaStep = QtWidgets.QLineEdit()
+        self.lineEditTwoThetaStep.setText(self.sett.value("DialogOpenFile/two_theta_step"))
+        self.slot_followToggled(self.checkBoxFollow.isChecked())
+
+        self.labelCalibration = QtWidgets.QLabel("Calibration")
+        self.comboBoxCalibration = QtWidgets.QComboBox()
+        self.comboBoxCalibration.addItems(list(parent.get_Calibrations()))
+        self.comboBoxCalibration.setCurrentText(self.sett.value("DialogOpenFile/calibration", fishcore.DEFAULT_CALIBRATION))
+
         self.buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
         self.buttonBox.accepted.connect(self.accept)
         self.buttonBox.rejected.connect(self.reject)
@@ -746,6 +2287,18 @@ class DialogOpenFile(QtWidgets.QDialog):
         self.verticalBoxLayout.addLayout(self.horizontalBoxLayout_TwoTheta)
         self.verticalBoxLayout.addSpacerItem(CustomSpacer('v'))
         self.verticalBoxLayout.addLayout(self.horizontalBoxLayout_Delimiter)
+        self.horizontalBoxLayout_Calibration = QtWidgets.QHBoxLayout()
+        self.horizontalBoxLayout_Calibration.addWidget(self.labelCalibration)
+        self.horizontalBoxLayout_Calibration.addWidget(self.comboBoxCalibration)
+        self.horizontalBoxLayout_Calibration.addSpacerItem(CustomSpacer('h'))
+        self.verticalBoxLayout.addLayout(self.horizontalBoxLayout_Calibration)
+        self.verticalBoxLayout.addSpacerItem(CustomSpacer('v'))
+        self.verticalBoxLayout.addWidget(self.checkBoxStream)
+        self.horizontalBoxLayout_Follow = QtWidgets.QHBoxLayout()
+        self.horizontalBoxLayout_Follow.addWidget(self.checkBoxFollow)
+        self.horizontalBoxLayout_Follow.addWidget(self.labelTwoThetaStep)
+        self.horizontalBoxLayout_Follow.addWidget(self.lineEditTwoThetaStep)
+        self.verticalBoxLayout.addLayout(self.horizontalBoxLayout_Follow)
         self.verticalBoxLayout.addSpacerItem(CustomSpacer('v'))
         self.verticalBoxLayout.addWidget(self.buttonBox)
 
@@ -753,13 +2306,17 @@ class DialogOpenFile(QtWidgets.QDialog):
 
     @QtCore.Slot()
     def accept(self):
-        if self.lineEditFile.text() == "":
+        if not self.get_Files():
             QtWidgets.QMessageBox.warning(self, "Warning", "The \"File\" field cannot be empty")
             return
         if self.lineEditTwoThetaStart.text() == "":
             QtWidgets.QMessageBox.warning(self, "Warning", "<html><head/><body><p align=\"right\">The \"2θ<span style=\" vertical-align:sub;\">start</span>\" field cannot be empty</p></body></html>")
             return
-        if self.lineEditTwoThetaEnd.text() == "":
+        if self.checkBoxFollow.isChecked():
+            if self.lineEditTwoThetaStep.text() == "":
+                QtWidgets.QMessageBox.warning(self, "Warning", "<html><head/><body><p align=\"right\">The \"2θ<span style=\" vertical-align:sub;\">step</span>\" field cannot be empty</p></body></html>")
+                return
+        elif self.lineEditTwoThetaEnd.text() == "":
             QtWidgets.QMessageBox.warning(self, "Warning", "<html><head/><body><p align=\"right\">The \"2θ<span style=\" vertical-align:sub;\">end</span>\" field cannot be empty</p></body></html>")
             return
 
@@ -767,7 +2324,20 @@ class DialogOpenFile(QtWidgets.QDialog):
 
     @QtCore.Slot()
     def slot_openFile(self):
-        self.lineEditFile.setText(QtWidgets.QFileDialog.getOpenFileName(self, "Open file", self.sett.value("DialogOpenFile/file"), "All files(*.*);;CSV files(*.csv);;Text files(*.txt)")[0])
+        lst = self.get_Files()
+        files = QtWidgets.QFileDialog.getOpenFileNames(self, "Open files", lst[0] if lst else "", "All files(*.*);;CSV files(*.csv);;Text files(*.txt)")[0]
+        if len(files) == 1:
+            self.lineEditFile.setText(files[0])
+        elif len(files) > 1:
+            self.lineEditFile.setText(" ".join("\"" + it + "\"" for it in files))
+
+    def get_Files(self):
+        text = self.lineEditFile.text().strip()
+        if text.startswith('"'):
+            return re.findall(r'"([^"]+)"', text)
+        if text == "":
+            return []
+        return [text]
 
     def getInput(self):
         delimiter = None
@@ -786,8 +2356,18 @@ class DialogOpenFile(QtWidgets.QDialog):
         self.sett.setValue("DialogOpenFile/delimiter", delimiter)
         self.sett.setValue("DialogOpenFile/two_theta_start", self.lineEditTwoThetaStart.text())
         self.sett.setValue("DialogOpenFile/two_theta_end", self.lineEditTwoThetaEnd.text())
+        self.sett.setValue("DialogOpenFile/stream", self.checkBoxStream.isChecked())
+        self.sett.setValue("DialogOpenFile/follow", self.checkBoxFollow.isChecked())
+        self.sett.setValue("DialogOpenFile/two_theta_step", self.lineEditTwoThetaStep.text())
+        self.sett.setValue("DialogOpenFile/calibration", self.comboBoxCalibration.currentText())
 
-        return [self.lineEditFile.text(), delimiter, self.lineEditTwoThetaStart.text(), self.lineEditTwoThetaEnd.text()]
+        return [self.get_Files(), delimiter, self.lineEditTwoThetaStart.text(), self.lineEditTwoThetaEnd.text(), self.checkBoxStream.isChecked(), self.checkBoxFollow.isChecked(), self.lineEditTwoThetaStep.text(), self.comboBoxCalibration.currentText()]
+
+    @QtCore.Slot(bool)
+    def slot_followToggled(self, checked):
+        self.lineEditTwoThetaStep.setEnabled(checked)
+        self.lineEditTwoThetaEnd.setEnabled(not checked)
+        self.checkBoxStream.setEnabled(not checked)
 
 
 class DialogSave(QtWidgets.QDialog):
@@ -828,6 +2408,9 @@ class DialogSave(QtWidgets.QDialog):
             self.vBoxLayoutDelimiter.addSpacerItem(CustomSpacer('h'))
             self.hBoxLayoutDelimiter.addWidget(self.labelDelimiter)
             self.hBoxLayoutDelimiter.addLayout(self.vBoxLayoutDelimiter)
+        else:
+            self.checkBoxRasterize = QtWidgets.QCheckBox("Rasterize pattern lines (SVG, PDF)")
+            self.checkBoxRasterize.setChecked(self.sett.value("DialogSave/rasterize", "false") == "true")
 
         self.labelPath = QtWidgets.QLabel("Path")
         self.lineEditPath = QtWidgets.QLineEdit()
@@ -880,10 +2463,10 @@ class DialogSave(QtWidgets.QDialog):
 
         i = None
         if self.pattern == 'table' or self.pattern == 'tables':
-            self.comboBoxFormat.addItems(("DAT file (*.dat)", "CSV file (*.csv)", "Text file (*.txt)"))
+            self.comboBoxFormat.addItems(("DAT file (*.dat)", "CSV file (*.csv)", "Text file (*.txt)", "NumPy array (*.npy)", "NumPy archive (*.npz)", "Binary float64 (*.bin)"))
             i = self.sett.value("DialogSave/format_table")
         elif self.pattern == 'plot' or self.pattern == 'plots':
-            self.comboBoxFormat.addItems(("JPEG file (*.jpg)", "PNG file (*.png)"))
+            self.comboBoxFormat.addItems(("JPEG file (*.jpg)", "PNG file (*.png)", "SVG file (*.svg)", "PDF file (*.pdf)"))
             i = self.sett.value("DialogSave/format_plot")
         if i == None:
             self.comboBoxFormat.setCurrentIndex(0)
@@ -912,6 +2495,9 @@ class DialogSave(QtWidgets.QDialog):
         if self.pattern == 'table' or self.pattern == 'tables':
             self.vBoxLayout.addLayout(self.hBoxLayoutDelimiter)
             self.vBoxLayout.addSpacerItem(CustomSpacer('v'))
+        else:
+            self.vBoxLayout.addWidget(self.checkBoxRasterize)
+            self.vBoxLayout.addSpacerItem(CustomSpacer('v'))
         self.vBoxLayout.addWidget(self.buttonBox)
 
         self.setLayout(self.vBoxLayout)
@@ -919,6 +2505,7 @@ class DialogSave(QtWidgets.QDialog):
     def getInput(self):
         self.sett.setValue("DialogSave/path", self.lineEditPath.text())
         delimiter = None
+        rasterize = False
         if self.pattern == 'table' or self.pattern == 'tables':
             vivisection = self.comboBoxDelimiter.currentIndex()
             if vivisection == 0:
@@ -933,18 +2520,20 @@ class DialogSave(QtWidgets.QDialog):
             self.sett.setValue("DialogSave/format_table",self.comboBoxFormat.currentIndex())
         elif self.pattern == 'plot' or self.pattern == 'plots':
             self.sett.setValue("DialogSave/format_plot",self.comboBoxFormat.currentIndex())
+            rasterize = self.checkBoxRasterize.isChecked()
+            self.sett.setValue("DialogSave/rasterize", rasterize)
 
         if self.pattern == 'table' or self.pattern == 'plot':
             self.sett.setValue("DialogSave/file_name", self.lineEditFileName.text())
             file = self.lineEditPath.text() + '/' + self.lineEditFileName.text() + self.comboBoxFormat.currentText().split('*')[-1][:-1]
-            return [self.comboBoxWindows.currentText(), file, delimiter]
+            return [self.comboBoxWindows.currentText(), file, delimiter, rasterize]
         elif self.pattern == 'tables' or self.pattern == 'plots':
             path = self.lineEditPath.text() + '/'
             files = []
             for checkbox in self.groupBox.findChildren(QtWidgets.QCheckBox):
                 if checkbox.isChecked():
                     files.append(checkbox.text())
-            return [path, files, self.comboBoxFormat.currentText().split('*')[-1][:-1], delimiter]
+            return [path, files, self.comboBoxFormat.currentText().split('*')[-1][:-1], delimiter, rasterize]
 
     @QtCore.Slot()
     def slot_ButtonFileName(self):
@@ -957,6 +2546,93 @@ class DialogSave(QtWidgets.QDialog):
         self.lineEditPath.setText(QtWidgets.QFileDialog.getExistingDirectory(self, "Get file name", self.lineEditPath.text()))
 
 
+class PerformanceDock(QtWidgets.QDockWidget):
+    recorded = QtCore.Signal(object)
+
+    MAX_ROWS = 1000
+
+    def __init__(self, parent):
+        super().__init__("Performance", parent)
+        self.setObjectName("Performance")
+
+        self.sett = QtCore.QSettings(PROGRAM_PATH + "/settings.ini", QtCore.QSettings.IniFormat)
+
+        self.checkBoxRecord = QtWidgets.QCheckBox("Record")
+        self.checkBoxRecord.setChecked(self.sett.value("Performance/record", "false") == "true")
+        self.checkBoxRecord.setToolTip("Record wall time, rows and peak traced memory of each operation. Memory tracing slows the program down while enabled.")
+
+        self.checkBoxLog = QtWidgets.QCheckBox("Write log")
+        self.checkBoxLog.setChecked(self.sett.value("Performance/log", "false") == "true")
+        self.checkBoxLog.setToolTip("Append the records as JSON lines to " + PROGRAM_PATH + "/performance.jsonl")
+
+        pushButtonClear = QtWidgets.QPushButton("Clear")
+        pushButtonClear.clicked.connect(self.slot_clear)
+
+        self.tableWidget = QtWidgets.QTableWidget(0, 7)
+        self.tableWidget.setHorizontalHeaderLabels(["Time", "Operation", "Wall, ms", "Rows", "Peak memory, MB", "Thread", "Details"])
+        self.tableWidget.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.tableWidget.verticalHeader().hide()
+        self.tableWidget.horizontalHeader().setStretchLastSection(True)
+
+        hBoxLayout = QtWidgets.QHBoxLayout()
+        hBoxLayout.addWidget(self.checkBoxRecord)
+        hBoxLayout.addWidget(self.checkBoxLog)
+        hBoxLayout.addStretch()
+        hBoxLayout.addWidget(pushButtonClear)
+
+        vBoxLayout = QtWidgets.QVBoxLayout()
+        vBoxLayout.addLayout(hBoxLayout)
+        vBoxLayout.addWidget(self.tableWidget)
+        vBoxLayout.setMargin(2)
+
+        widget = QtWidgets.QWidget()
+        widget.setLayout(vBoxLayout)
+        self.setWidget(widget)
+
+        # Records may come from worker threads; the signal queues them to the GUI thread
+        self.recorded.connect(self.slot_recorded)
+        fishcore.PROFILER.listeners.append(self.recorded.emit)
+
+        self.checkBoxRecord.toggled.connect(self.slot_configure)
+        self.checkBoxLog.toggled.connect(self.slot_configure)
+        self.slot_configure()
+
+    @QtCore.Slot()
+    def slot_configure(self):
+        record = self.checkBoxRecord.isChecked()
+        log = self.checkBoxLog.isChecked()
+        self.sett.setValue("Performance/record", "true" if record else "false")
+        self.sett.setValue("Performance/log", "true" if log else "false")
+        try:
+            fishcore.PROFILER.configure(record, PROGRAM_PATH + "/performance.jsonl" if log else None)
+        except OSError:
+            QtWidgets.QMessageBox.critical(self, "Error", traceback.format_exc())
+
+    @QtCore.Slot()
+    def slot_clear(self):
+        fishcore.PROFILER.clear()
+        self.tableWidget.setRowCount(0)
+
+    @QtCore.Slot(object)
+    def slot_recorded(self, record):
+        row = self.tableWidget.rowCount()
+        if row >= self.MAX_ROWS:
+            self.tableWidget.removeRow(0)
+            row -= 1
+        details = ", ".join(str(k) + "=" + str(v) for k, v in record.items() if k not in ("time", "stage", "seconds", "rows", "peak_bytes", "thread"))
+        values = [time.strftime("%H:%M:%S", time.localtime(record["time"])),
+                  record["stage"],
+                  "%.1f" % (record["seconds"] * 1000),
+                  "" if record["rows"] is None else str(record["rows"]),
+                  "" if record["peak_bytes"] is None else "%.2f" % (record["peak_bytes"] / 2 ** 20),
+                  record["thread"],
+                  details]
+        self.tableWidget.insertRow(row)
+        for column, value in enumerate(values):
+            self.tableWidget.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+        self.tableWidget.scrollToBottom()
+
+
 class CustomSpacer(QtWidgets.QSpacerItem):
     def __init__(self, orientation):
         if orientation == 'v':
@@ -965,53 +2641,226 @@ class CustomSpacer(QtWidgets.QSpacerItem):
             super().__init__(0, 0, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
 
 
+class FishTask(QtCore.QRunnable):
+    def __init__(self, worker):
+        super().__init__()
+        self.worker = worker
+
+    def run(self):
+        self.worker.run()
+
+
+class FishExport(QtCore.QObject):
+    quit = QtCore.Signal(str)
+
+    def __init__(self, file_name, columns, names, delimiter, batch):
+        super().__init__()
+
+        self.file_name = file_name
+        self.columns = columns
+        self.names = names
+        self.delimiter = delimiter
+        self.batch = batch
+
+    def run(self):
+        err = ""
+        if not self.batch['cancelled'].is_set():
+            try:
+                with fishcore.PROFILER.stage("export", len(self.columns[0]), file=os.path.basename(self.file_name)):
+                    fishcore.saveColumns(self.file_name, self.columns, self.names, self.delimiter)
+            except Exception:
+                err = traceback.format_exc()
+        self.quit.emit(err)
+
+
+class FishRender(QtCore.QObject):
+    quit = QtCore.Signal(str)
+
+    def __init__(self, batch):
+        super().__init__()
+
+        self.batch = batch
+
+    def start(self, future, file_name, rows):
+        self.file_name = file_name
+        self.rows = rows
+        self.clock = time.perf_counter()
+        self.batch['futures'].append(future)
+        future.add_done_callback(self.done)
+
+    def done(self, future):
+        # Called from the executor thread; the signal is queued to the GUI thread
+        if fishcore.PROFILER.enabled:
+            fishcore.PROFILER.record("render plot", time.perf_counter() - self.clock, self.rows, None, {'file': os.path.basename(self.file_name)})
+        err = ""
+        if not future.cancelled() and future.exception() is not None:
+            e = future.exception()
+            err = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+        self.quit.emit(err)
+
+
+class FishFit(QtCore.QObject):
+    quit = QtCore.Signal(str)
+
+    def __init__(self, batch, start, count):
+        super().__init__()
+
+        self.batch = batch
+        self.start_index = start
+        self.count = count
+
+    def start(self, future):
+        self.batch['futures'].append(future)
+        future.add_done_callback(self.done)
+
+    def done(self, future):
+        err = ""
+        if not future.cancelled():
+            if future.exception() is not None:
+                e = future.exception()
+                err = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+            else:
+                self.batch['results'][self.start_index:self.start_index + self.count] = future.result()
+        self.quit.emit(err)
+
+
+class FishFollower(QtCore.QObject):
+    updated = QtCore.Signal(object, int)
+    errorSignal = QtCore.Signal(str)
+
+    def __init__(self, file_name, separator, min_A, step, interval, parent=None, calibration=None):
+        super().__init__(parent)
+
+        self.reader = fishcore.TailReader(file_name, separator)
+        self.live = fishcore.LiveConverter(min_A, step, calibration)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.poll)
+
+    def start(self):
+        self.timer.start()
+        self.poll()
+
+    @QtCore.Slot()
+    def stop(self):
+        self.timer.stop()
+
+    @QtCore.Slot()
+    def poll(self):
+        try:
+            count = self.live.count
+            if self.live.feed(self.reader.read()) > count:
+                self.updated.emit(self.live, self.live.count)
+        except Exception:
+            self.stop()
+            self.errorSignal.emit(traceback.format_exc())
+
+
 class FishThread(QtCore.QObject):
-    finished = QtCore.Signal(str, pandas.DataFrame)
+    finished = QtCore.Signal(str, object)
+    opened = QtCore.Signal(str, object, object)
+    streamed = QtCore.Signal(object, int, bool)
     quit = QtCore.Signal()
     errorSignal = QtCore.Signal(str)
 
-    def __init__(self, file_name, separator, min_A, max_A):
+    def __init__(self, file_name, separator, min_A, max_A, stream=False, cache=None, calibration=None):
         super().__init__()
 
         self.file_name = file_name
         self.separator = separator
         self.min_A = float(min_A)
         self.max_A = float(max_A)
+        self.stream = stream
+        self.cache = cache
+        self.calibration = calibration or fishcore.DRON_2
+        self.openStream = None
 
     def run(self):
         try:
-            data = pandas.read_csv(self.file_name, sep=self.separator)
-            minIndex = 0
-            n = len(data)-1
-            two_theta = [self.min_A + i * ((self.max_A-self.min_A)/(n-1)) for i in range(minIndex, n)]
-            intensity = [float(data['Value'][i + 1]) for i in range(minIndex, n)]
-            two_theta_n = ["%.3f" % (two_theta[i] - (0.544+0.000599591 * two_theta[i])) for i in range(1, n)]
-            intensity_n = [intensity[i] for i in range(minIndex, n-1)]
-
-            Data = pandas.DataFrame({'two_theta': two_theta_n, 'intensity': intensity_n})
+            profiler = fishcore.PROFILER
+            file = os.path.basename(self.file_name)
+            key = None
+            if self.cache is not None:
+                with profiler.stage("cache read", file=file) as stage:
+                    key = self.cache.key(self.file_name, self.separator, self.min_A, self.max_A, self.calibration.key())
+                    data = self.cache.get(key)
+                    if data is not None:
+                        stage.rows = len(data[0])
+                if data is not None:
+                    self.finished.emit(self.file_name, {'two_theta': data[0], 'intensity': data[1], 'meta': self.get_Meta()})
+                    return
+            if self.stream:
+                with profiler.stage("convert (stream)", file=file) as stage:
+                    two_theta, intensity = self.runStream()
+                    stage.rows = len(two_theta)
+            else:
+                with profiler.stage("convert", file=file) as stage:
+                    two_theta, intensity = fishcore.convertFile(self.file_name, self.separator, self.min_A, self.max_A, self.calibration)
+                    stage.rows = len(two_theta)
+                self.finished.emit(self.file_name, {'two_theta': two_theta, 'intensity': intensity, 'meta': self.get_Meta()})
+            if key is not None:
+                # The cache is only an optimisation, a failed write is not an import error
+                try:
+                    with profiler.stage("cache write", len(two_theta), file=file):
+                        self.cache.put(key, two_theta, intensity)
+                except Exception:
+                    pass
         except Exception:
             self.errorSignal.emit(traceback.format_exc())
-        else:
-            self.finished.emit(self.file_name, Data)
         finally:
             self.quit.emit()
 
+    def get_Meta(self):
+        return {'file': self.file_name, 'separator': self.separator, 'start': self.min_A, 'end': self.max_A, 'calibration': self.calibration.name}
+
+    def runStream(self):
+        stream = fishcore.StreamConverter(fishcore.countRows(self.file_name), self.min_A, self.max_A, self.calibration)
+        self.openStream = stream
+        self.opened.emit(self.file_name, stream, self.get_Meta())
+        for values in fishcore.readChunks(self.file_name, self.separator):
+            self.streamed.emit(stream, stream.feed(values), False)
+        self.streamed.emit(stream, stream.finish(), True)
+        return stream.two_theta, stream.intensity
+
+
+def warmUp():
+    for name in WARM_UP_MODULES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception:
+            # The error is shown when the module is imported again where it is needed
+            break
+        startupTime("import " + name + " (background)", start)
+
 
 def main():
+    start = time.perf_counter()
     app = QtWidgets.QApplication(sys.argv)
+    start = startupTime("QApplication", start)
 
     splash = QtWidgets.QSplashScreen(QtGui.QPixmap(PROGRAM_PATH + "/img/FishX-SS.png"))
     splash.show()
+    start = startupTime("splash screen", start)
 
     app.setApplicationName("FishX")
     app.setApplicationVersion("1.0.2")
     app.setWindowIcon(QtGui.QIcon(PROGRAM_PATH + "/img/FishX.png"))
 
     win = MainWindow()
+    start = startupTime("MainWindow", start)
     win.show()
+    startupTime("MainWindow.show", start)
 
     splash.finish(win)
 
+    def ready():
+        startupTime("main window ready (since start)", STARTUP_CLOCK)
+        threading.Thread(target=warmUp, daemon=True).start()
+
+    QtCore.QTimer.singleShot(0, ready)
+
     ####
     # win.slot_openFile()
     ####
@@ -1020,4 +2869,5 @@ def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,162 @@
+import os
+import sys
+import math
+
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fishcore
+
+
+def listConvert(values, min_A, max_A):
+    # The list based conversion fishx used before the NumPy engine
+    n = len(values) - 1
+    two_theta = [min_A + i * ((max_A - min_A) / (n - 1)) for i in range(0, n)]
+    intensity = [float(values[i + 1]) for i in range(0, n)]
+    two_theta_n = ["%.3f" % (two_theta[i] - (0.544 + 0.000599591 * two_theta[i])) for i in range(1, n)]
+    intensity_n = [intensity[i] for i in range(0, n - 1)]
+    return numpy.array(two_theta_n, dtype=float), numpy.array(intensity_n)
+
+
+def naiveStripKa2(x, y, ka1, ka2, ratio):
+    # Rachinger correction one point at a time
+    out = []
+    for i in range(len(x)):
+        source = 2 * x[i] - 2 * math.degrees(math.asin(min(ka2 / ka1 * math.sin(math.radians(x[i] / 2)), 1.0)))
+        if source < x[0]:
+            out.append(y[i])
+            continue
+        a = min(max(int(numpy.searchsorted(x, source, "right")) - 1, 0), len(x) - 2)
+        w = min(max((source - x[a]) / (x[a + 1] - x[a]), 0.0), 1.0)
+        if a + 1 < i:
+            out.append(y[i] - ratio * ((1 - w) * out[a] + w * out[a + 1]))
+        elif a + 1 == i:
+            out.append((y[i] - ratio * (1 - w) * out[a]) / (1 + ratio * w))
+        else:
+            out.append(y[i] / (1 + ratio))
+    return numpy.array(out)
+
+
+@pytest.mark.parametrize("rows, min_A, max_A", [(3, 10, 90), (1001, 10, 90), (25000, 5.5, 120.25)])
+def test_convert_matches_list_conversion(rows, min_A, max_A):
+    values = numpy.random.default_rng(rows).integers(0, 5000, rows).astype(float)
+    two_theta, intensity = fishcore.convert(values, min_A, max_A)
+    expected_two_theta, expected_intensity = listConvert(values, min_A, max_A)
+    # Both round to 0.001°; half-way cases may round either way
+    numpy.testing.assert_allclose(two_theta, expected_two_theta, rtol=0, atol=1.0001e-3)
+    assert numpy.mean(two_theta == expected_two_theta) > 0.99
+    numpy.testing.assert_array_equal(intensity, expected_intensity)
+
+
+def test_stream_converter_matches_convert():
+    values = numpy.random.default_rng(1).integers(0, 5000, 2500).astype(float)
+    stream = fishcore.StreamConverter(len(values), 10, 90)
+    for start in range(0, len(values), 700):
+        stream.feed(values[start:start + 700])
+    count = stream.finish()
+    two_theta, intensity = fishcore.convert(values, 10, 90)
+    numpy.testing.assert_array_equal(stream.two_theta[:count], two_theta)
+    numpy.testing.assert_array_equal(stream.intensity[:count], intensity)
+
+
+@pytest.mark.parametrize("x", [numpy.arange(10, 90, 0.02), numpy.arange(1, 30, 0.05), numpy.arange(100, 179.9, 0.05),
+                               numpy.sort(numpy.random.default_rng(2).uniform(5, 120, 2000))])
+@pytest.mark.parametrize("ratio", [0.5, 0.3])
+def test_strip_ka2_matches_naive_loop(x, ratio):
+    y = numpy.random.default_rng(3).poisson(100 + 1000 * numpy.exp(-((x - x.mean()) / 0.2) ** 2)).astype(float)
+    ka1, ka2 = fishcore.ANODES["Cu"]
+    numpy.testing.assert_allclose(fishcore.stripKa2(x, y, ka1, ka2, ratio), naiveStripKa2(x, y, ka1, ka2, ratio), rtol=1e-9, atol=1e-8)
+
+
+@pytest.mark.parametrize("profile", fishcore.PROFILES)
+def test_profile_jacobian_matches_numeric_derivatives(profile):
+    x = numpy.stack((numpy.linspace(28, 32, 81), numpy.linspace(40, 44, 81)))
+    t = numpy.broadcast_to(numpy.linspace(-1, 1, 81), x.shape)
+    shape = 0.4 if profile == "pseudo-Voigt" else 2.5
+    p = numpy.array([[900, 29.8, 0.3, shape, 300, 29.9, 0.5, shape, 50, 3, -1],
+                     [400, 42.1, 0.2, shape, 700, 41.7, 0.4, shape, 20, -2, 0.5]])
+    y, jacobian = fishcore.profileModel(profile, x, p, 2, t)
+    numeric = numpy.empty_like(jacobian)
+    for j in range(p.shape[1]):
+        h = 1e-6 * max(abs(p[0, j]), abs(p[1, j]), 1)
+        up, down = p.copy(), p.copy()
+        up[:, j] += h
+        down[:, j] -= h
+        numeric[..., j] = (fishcore.profileModel(profile, x, up, 2, t, False) - fishcore.profileModel(profile, x, down, 2, t, False)) / (2 * h)
+    numpy.testing.assert_allclose(y, fishcore.profileModel(profile, x, p, 2, t, False))
+    numpy.testing.assert_allclose(jacobian, numeric, rtol=1e-5, atol=1e-5 * numpy.abs(numeric).max())
+
+
+@pytest.mark.parametrize("profile", fishcore.PROFILES)
+def test_fit_recovers_peak(profile):
+    x = numpy.arange(25, 35, 0.01)
+    shape = 0.3 if profile == "pseudo-Voigt" else 3.0
+    p = numpy.array([[2000, 30.05, 0.25, shape, 100, 5]])
+    t = (x - 30) / 5
+    y = fishcore.profileModel(profile, x, p, 1, t, False)[0]
+    result = fishcore.fitPatterns([(x, y)], 25, 35, profile)[0]
+    assert result['converged']
+    numpy.testing.assert_allclose(result['peaks'][0], p[0, :4], rtol=1e-3)
+    numpy.testing.assert_allclose(result['fit'], y, rtol=1e-4)
+
+
+def test_levenberg_marquardt_solves_rows_independently():
+    x = numpy.linspace(0, 1, 50)
+    truth = numpy.array([[2.0, -1.0], [0.5, 3.0], [-4.0, 0.25]])
+    y = truth[:, :1] * numpy.exp(truth[:, 1:] * x)
+
+    def func(p, rows, jacobian=True):
+        e = numpy.exp(p[:, 1:] * x)
+        model = p[:, :1] * e
+        if not jacobian:
+            return model
+        return model, numpy.stack((e, p[:, :1] * x * e), axis=-1)
+
+    p, alpha, chi2, iterations, converged = fishcore.levenbergMarquardt(
+        func, numpy.ones((3, 2)), y, numpy.ones_like(y), numpy.full((3, 2), -10.0), numpy.full((3, 2), 10.0))
+    assert converged.all()
+    numpy.testing.assert_allclose(p, truth, rtol=1e-5, atol=1e-6)
+
+
+def test_find_peaks():
+    x = numpy.arange(20, 60, 0.01)
+    y = 50 + 1000 * numpy.exp(-((x - 30) / 0.1) ** 2) + 400 * numpy.exp(-((x - 45) / 0.15) ** 2)
+    peaks = fishcore.findPeaks([(x, y)], fishcore.ANODES["Cu"][0])[0]
+    column = fishcore.PEAK_COLUMNS.index
+    numpy.testing.assert_allclose(peaks[:, column("two_theta")], [30, 45], atol=0.01)
+    numpy.testing.assert_allclose(peaks[:, column("fwhm")], [0.2 * math.sqrt(math.log(2)), 0.3 * math.sqrt(math.log(2))], rtol=0.05)
+
+
+def test_snip_background_keeps_baseline_under_peaks():
+    x = numpy.arange(20, 60, 0.01)
+    baseline = 100 + 2 * (x - 20)
+    y = baseline + 1000 * numpy.exp(-((x - 40) / 0.1) ** 2)
+    background = fishcore.snipBackground(y, 60)
+    inner = slice(100, -100)
+    assert numpy.abs(background - baseline)[inner].max() < 5
+    assert (background <= y + 1e-9).all()
+
+
+def test_calibration_apply_matches_correction():
+    calibration = fishcore.Calibration("cubic", "polynomial", (0.1, 0.01, 1e-4, 1e-6))
+    two_theta = numpy.array([-20.0, 0.0, 12.3456, 45.1234, 179.9, 180.0, 190.0, 250.0])
+    expected = numpy.round(two_theta - calibration.correction(two_theta), 3)
+    numpy.testing.assert_array_equal(calibration.apply(two_theta.copy()), expected)
+    linear = fishcore.DRON_2
+    numpy.testing.assert_array_equal(linear.apply(two_theta.copy()), numpy.round(two_theta - linear.correction(two_theta), 3))
+    table = fishcore.Calibration("table", "table", points=[(10, 0.1), (100, 0.3)])
+    numpy.testing.assert_allclose(table.apply(numpy.array([0.0, 55.0, 200.0])), [-0.1, 54.8, 199.7])
+
+
+def test_common_grid():
+    x = numpy.arange(10, 20, 0.01)
+    grid = fishcore.commonGrid([(x, x), (x.copy(), x)])
+    numpy.testing.assert_array_equal(grid, x)
+    assert not numpy.shares_memory(grid, x)
+    grid = fishcore.commonGrid([(numpy.arange(10, 20, 0.01), x), (numpy.arange(12, 25, 0.02), x)])
+    assert grid[0] == 12 and grid[-1] <= 20 + 1e-9
+    numpy.testing.assert_allclose(numpy.diff(grid), 0.015)
+    with pytest.raises(ValueError):
+        fishcore.commonGrid([(numpy.arange(0, 1, 0.1), x), (numpy.arange(2, 3, 0.1), x)])